@@ -1,37 +1,97 @@
 import json
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
-from django.contrib.auth.models import User
+from channels.layers import get_channel_layer
 from todo_project.models import Message,PrivateMessage, Conversation
+from todo_project.realtime import notification_group, task_group
+from .persistence import writer
+from .presence import hub
 
-class ChatConsumer(AsyncWebsocketConsumer):
+
+def conversation_group(conversation_id):
+    return f"private_chat_{conversation_id}"
+
+
+def notify_conversation_deleted(conversation_id):
+    """Tell the open sockets of a conversation that it is gone, see PrivateChatConsumer.conversation_deleted."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(conversation_group(conversation_id), {"type": "conversation.deleted"})
+
+
+class PresenceMixin:
+    """Online and typing indicators for a chat consumer, see chat/presence.py."""
+    presence_group = None
+
+    async def join_presence(self, group):
+        self.presence_group = group
+        hub.join(group, self.user.username)
+        hub.start()
+        # Who is already here, later changes arrive through presence_changed
+        await self.send(text_data=json.dumps({"type": "presence", "changes": hub.snapshot(group)}))
+
+    def leave_presence(self):
+        if self.presence_group is not None:
+            hub.leave(self.presence_group, self.user.username)
+            self.presence_group = None
+
+    def presence_frame(self, data):
+        """Record a typing or ping frame and return True, or return False for a chat message."""
+        kind = data.get("type")
+        if kind == "typing":
+            hub.typed(self.presence_group, self.user.username)
+        elif kind == "ping":
+            hub.touch(self.presence_group, self.user.username)
+        else:
+            hub.stopped_typing(self.presence_group, self.user.username)
+            hub.touch(self.presence_group, self.user.username)
+            return False
+        return True
+
+    async def presence_changed(self, event):
+        await self.send(text_data=json.dumps({"type": "presence", "changes": event["changes"]}))
+
+
+class ChatConsumer(PresenceMixin, AsyncWebsocketConsumer):
     async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
         self.roomGroupName = "group_chat_gfg"
         await self.channel_layer.group_add(
             self.roomGroupName,
             self.channel_name
         )
         await self.accept()
+        await self.join_presence(self.roomGroupName)
 
     async def disconnect(self, close_code):
+        if not self.user.is_authenticated:
+            return
+        self.leave_presence()
         await self.channel_layer.group_discard(
             self.roomGroupName,
             self.channel_name
         )
+        # Whatever this socket sent is in the database once it is gone
+        await writer.flush()
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
+        if self.presence_frame(text_data_json):
+            return
         message = text_data_json["message"]
-        username = text_data_json["username"]
 
-        # Save message to the database
-        await self.save_message(username, message)
+        # Saved in the background with the next batch, see chat/persistence.py
+        await writer.put(Message(sender=self.user, content=message, room_name=self.roomGroupName))
 
         await self.channel_layer.group_send(
             self.roomGroupName, {
                 "type": "sendMessage",
                 "message": message,
-                "username": username,
+                "username": self.user.username,
             }
         )
 
@@ -43,22 +103,25 @@ class ChatConsumer(AsyncWebsocketConsumer):
             "username": username
         }))
 
-    @sync_to_async
-    def save_message(self, username, message):
-        user = User.objects.get(username=username)
-        Message.objects.create(sender=user, content=message, room_name=self.roomGroupName)
 
 
 
 
 
 
+class PrivateChatConsumer(PresenceMixin, AsyncWebsocketConsumer):
+    conversation = None
 
-class PrivateChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
         self.conversation_id = self.scope["url_route"]["kwargs"]["conversation_id"]
-        self.conversation_group_name = f"private_chat_{self.conversation_id}"
+        self.conversation_group_name = conversation_group(self.conversation_id)
+
+        # Checked once here, every message of this socket then reuses the conversation
+        self.conversation = await self.load_conversation()
+        if self.conversation is None:
+            await self.close()
+            return
 
         # Join the conversation group
         await self.channel_layer.group_add(
@@ -66,19 +129,25 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         await self.accept()
+        await self.join_presence(self.conversation_group_name)
 
     async def disconnect(self, close_code):
+        self.leave_presence()
         await self.channel_layer.group_discard(
             self.conversation_group_name,
             self.channel_name
         )
+        await writer.flush()
 
     async def receive(self, text_data):
+        if self.conversation is None:
+            return  # deleted while the socket was open
         text_data_json = json.loads(text_data)
+        if self.presence_frame(text_data_json):
+            return
         message = text_data_json["message"]
 
-        # Save message to the database
-        await self.save_message(message)
+        await writer.put(PrivateMessage(conversation=self.conversation, sender=self.user, content=message))
 
         await self.channel_layer.group_send(
             self.conversation_group_name, {
@@ -88,6 +157,21 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             }
         )
 
+    async def conversation_deleted(self, event):
+        # Sent by delete_chat, nothing more can be saved to this conversation
+        self.conversation = None
+        await self.close()
+
+    @sync_to_async
+    def load_conversation(self):
+        """The conversation with its participants, or None unless the socket user is one of them."""
+        if not self.user.is_authenticated:
+            return None
+        conversation = Conversation.objects.filter(id=self.conversation_id).prefetch_related("participants").first()
+        if conversation is None or self.user not in conversation.participants.all():
+            return None
+        return conversation
+
     async def sendMessage(self, event):
         message = event["message"]
         username = event["username"]
@@ -96,7 +180,45 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             "username": username
         }))
 
-    @sync_to_async
-    def save_message(self, message):
-        conversation = Conversation.objects.get(id=self.conversation_id)
-        PrivateMessage.objects.create(conversation=conversation, sender=self.user, content=message)
\ No newline at end of file
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """Pushes new notifications and unread count changes to the navbar, see todo_project/realtime.py."""
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = notification_group(self.user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.user.is_authenticated:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notifications_push(self, event):
+        await self.send(text_data=json.dumps({
+            "notifications": event["notifications"],
+            "unread_delta": event["unread_delta"],
+        }))
+
+
+class TaskEventConsumer(AsyncWebsocketConsumer):
+    """Sends the task lists of a user compact diffs of the tasks they own or are assigned, see todo_project/realtime.py."""
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = task_group(self.user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.user.is_authenticated:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def tasks_changed(self, event):
+        await self.send(text_data=json.dumps({"tasks": event["tasks"]}))
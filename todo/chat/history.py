@@ -0,0 +1,33 @@
+from django.conf import settings
+
+from todo_project.pagination import cursor_filter, encode_cursor
+
+
+# Messages rendered with a chat page and returned per "load older" request
+PAGE_SIZE = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+
+
+def history_window(messages, before=None, size=None):
+    """
+    The `size` latest messages of `messages` older than the `before` cursor, oldest first.
+
+    Walks the (room or conversation, timestamp, id) index backwards and stops after
+    size + 1 rows, so a page costs the same however long the history is. Returns
+    (messages, cursor for the next older page or None).
+    """
+    size = size or PAGE_SIZE
+    messages = messages.select_related('sender').order_by('-timestamp', '-pk')
+    if before:
+        messages = messages.filter(cursor_filter(messages.model, 'timestamp', before, descending=True))
+    rows = list(messages[:size + 1])
+    older = encode_cursor(rows[size - 1], 'timestamp') if len(rows) > size else None
+    return rows[:size][::-1], older
+
+
+def serialize(message):
+    return {
+        'id': message.pk,
+        'username': message.sender.username,
+        'message': message.content,
+        'timestamp': message.timestamp.isoformat(),
+    }
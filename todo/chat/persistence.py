@@ -0,0 +1,112 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from todo_project.models import Conversation, Message, PrivateMessage
+from todo_project.search import index_on_commit
+
+
+logger = logging.getLogger(__name__)
+
+# A batch is written once it holds BATCH_SIZE messages or INTERVAL seconds after its first one
+BATCH_SIZE = getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 100)
+INTERVAL = getattr(settings, 'CHAT_WRITE_INTERVAL', 0.05)
+
+# Queued messages per process before consumers wait for the database to catch up
+MAX_PENDING = getattr(settings, 'CHAT_WRITE_MAX_PENDING', 1000)
+
+
+def write_messages(messages):
+    """One INSERT per model for a batch of unsaved Message and PrivateMessage instances."""
+    conversation_ids = {message.conversation_id for message in messages if type(message) is PrivateMessage}
+    if conversation_ids:
+        # Conversations deleted since the messages were queued would fail the whole batch
+        conversation_ids = set(Conversation.objects.filter(pk__in=conversation_ids).values_list('pk', flat=True))
+    for model in (Message, PrivateMessage):
+        rows = [
+            message for message in messages
+            if type(message) is model and (model is Message or message.conversation_id in conversation_ids)
+        ]
+        if rows:
+            # bulk_create skips post_save, so index the rows the way update_search_index would
+            index_on_commit(model.objects.bulk_create(rows))
+
+
+class MessageWriter:
+    """
+    Write-behind queue for chat messages.
+
+    Consumers broadcast straight away and hand the unsaved row to put(), a background
+    task on the event loop saves them in batches, so the thread pool is entered once
+    per batch instead of once per message. put() waits when MAX_PENDING messages
+    are queued, which slows senders down instead of growing the queue without bound.
+    Rows get their timestamp when the batch is written, ids keep the sending order.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, interval=INTERVAL, max_pending=MAX_PENDING):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.loop = None
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            # First use, or the previous event loop is gone along with its queue
+            self.loop = loop
+            self.queue = asyncio.Queue(self.max_pending)
+            self.task = None
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self.run())
+
+    async def put(self, message):
+        self.start()
+        await self.queue.put(message)
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - self.loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await sync_to_async(write_messages)(batch)
+            except Exception:
+                logger.exception("Could not save %d chat messages", len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def flush(self):
+        """Wait until everything queued so far is written."""
+        if self.queue is not None and self.loop is asyncio.get_running_loop():
+            self.start()
+            await self.queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+writer = MessageWriter()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan handler, saves the queued messages before the server stops."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await writer.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a socket counts as online after its last message or ping, the pages ping well within this
+PRESENCE_TTL = getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+
+# Seconds someone shows as typing after their last keystroke
+TYPING_TTL = getattr(settings, 'CHAT_TYPING_TTL', 3)
+
+# Each group gets at most one presence event per interval, with every change since the last one
+FANOUT_INTERVAL = getattr(settings, 'CHAT_PRESENCE_INTERVAL', 0.5)
+
+
+class RoomPresence:
+    def __init__(self):
+        self.sockets = defaultdict(int)  # username -> open sockets in this process, until they disconnect
+        self.seen = {}  # username -> when their presence expires, only users shown as online
+        self.typing = {}  # username -> when their typing indicator expires
+        self.changes = {}  # username -> {'online': bool, 'typing': bool}, waiting for the next fan out
+
+    def change(self, username, **state):
+        # Later changes of the same user overwrite earlier ones, only the latest state goes out
+        self.changes.setdefault(username, {}).update(state)
+
+
+class PresenceHub:
+    """
+    Who is online and who is typing in each chat group, for the sockets of this process.
+
+    Keystrokes only refresh an expiry time: a user going from idle to typing (or
+    back once TYPING_TTL passes) is a change, the keystrokes in between are not.
+    Changes are collected per sender and a background task sends each group one
+    event per FANOUT_INTERVAL at most, so a busy room costs a bounded number of
+    channel layer sends however fast people type. Users whose sockets stop pinging
+    show as offline after PRESENCE_TTL, which also covers sockets that never got a
+    disconnect. Open sockets stay counted, so the next ping, keystroke or message
+    brings their user back online. Every process tracks its own sockets and
+    announces their changes to the whole group through the channel layer.
+    """
+
+    def __init__(self, interval=FANOUT_INTERVAL, presence_ttl=PRESENCE_TTL, typing_ttl=TYPING_TTL, clock=time.monotonic):
+        self.interval = interval
+        self.presence_ttl = presence_ttl
+        self.typing_ttl = typing_ttl
+        self.clock = clock
+        self.rooms = defaultdict(RoomPresence)
+        self.loop = None
+        self.task = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop or self.task is None or self.task.done():
+            self.loop = loop
+            self.task = loop.create_task(self.run())
+
+    def snapshot(self, group):
+        """{username: {'online', 'typing'}} of everyone currently in the group, for a socket that just joined."""
+        room = self.rooms[group]
+        return {username: {'online': True, 'typing': username in room.typing} for username in room.seen}
+
+    def join(self, group, username):
+        room = self.rooms[group]
+        room.sockets[username] += 1
+        if username not in room.seen:
+            room.change(username, online=True)
+        room.seen[username] = self.clock() + self.presence_ttl
+
+    def leave(self, group, username):
+        room = self.rooms[group]
+        room.sockets[username] -= 1
+        if room.sockets[username] <= 0:
+            # Last tab of this user closed
+            del room.sockets[username]
+            room.seen.pop(username, None)
+            room.typing.pop(username, None)
+            room.change(username, online=False, typing=False)
+
+    def touch(self, group, username):
+        room = self.rooms[group]
+        if username not in room.sockets:
+            return
+        if username not in room.seen:
+            # Expired while the socket stayed open (a throttled background tab...)
+            room.change(username, online=True)
+        room.seen[username] = self.clock() + self.presence_ttl
+
+    def typed(self, group, username):
+        room = self.rooms[group]
+        if username not in room.sockets:
+            return
+        self.touch(group, username)
+        if username not in room.typing:
+            room.change(username, typing=True)
+        room.typing[username] = self.clock() + self.typing_ttl
+
+    def stopped_typing(self, group, username):
+        room = self.rooms[group]
+        if room.typing.pop(username, None) is not None:
+            room.change(username, typing=False)
+
+    def expire(self):
+        now = self.clock()
+        for room in self.rooms.values():
+            for username in [username for username, until in room.typing.items() if until <= now]:
+                del room.typing[username]
+                room.change(username, typing=False)
+            for username in [username for username, until in room.seen.items() if until <= now]:
+                # The sockets stay counted, touch() brings the user back
+                del room.seen[username]
+                room.typing.pop(username, None)
+                room.change(username, online=False, typing=False)
+
+    def drain(self):
+        """{group: changes} collected since the last call, empty rooms are forgotten."""
+        self.expire()
+        batches = {}
+        for group, room in list(self.rooms.items()):
+            if room.changes:
+                batches[group], room.changes = room.changes, {}
+            if not room.sockets and not room.seen:
+                del self.rooms[group]
+        return batches
+
+    async def flush(self):
+        channel_layer = get_channel_layer()
+        for group, changes in self.drain().items():
+            try:
+                await channel_layer.group_send(group, {'type': 'presence.changed', 'changes': changes})
+            except Exception:
+                logger.exception("Could not send presence changes to %s", group)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+hub = PresenceHub()
@@ -1,3 +1,253 @@
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import AnonymousUser, User
+from unittest.mock import patch
+
 from django.test import TestCase
+from django.urls import reverse
+
+from todo_project.models import Task, Profile, Conversation, Message, PrivateMessage
+from .consumers import ChatConsumer, NotificationConsumer, PrivateChatConsumer, conversation_group
+from .history import history_window
+from .persistence import MessageWriter, write_messages
+from .presence import PresenceHub
+
+
+class ChatHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.carol = User.objects.create_user('carol', password='pw')
+        for user in (cls.alice, cls.bob, cls.carol):
+            Profile.objects.create(user=user)
+        for i in range(7):
+            Message.objects.create(sender=cls.alice if i % 2 else cls.bob, content=f'message {i}', room_name='group_chat_gfg')
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.alice, cls.bob)
+        for i in range(3):
+            PrivateMessage.objects.create(conversation=cls.conversation, sender=cls.alice, content=f'private {i}')
+
+    def test_window_walks_older_pages_without_overlap(self):
+        rooms = Message.objects.filter(room_name='group_chat_gfg')
+        pages, before = [], None
+        while True:
+            with self.assertNumQueries(1):
+                messages, before = history_window(rooms, before, size=3)
+            pages.append([message.content for message in messages])
+            if not before:
+                break
+        self.assertEqual(pages, [
+            ['message 4', 'message 5', 'message 6'],
+            ['message 1', 'message 2', 'message 3'],
+            ['message 0'],
+        ])
+
+    def test_history_endpoints(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('chat-history')).json()
+        self.assertEqual([m['message'] for m in response['messages']], [f'message {i}' for i in range(7)])
+        self.assertIsNone(response['older'])
+        response = self.client.get(reverse('private-chat-history', args=[self.conversation.pk])).json()
+        self.assertEqual([m['username'] for m in response['messages']], ['alice'] * 3)
+
+        self.client.force_login(self.carol)
+        self.assertEqual(self.client.get(reverse('private-chat-history', args=[self.conversation.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('chat-history'), {'before': 'garbage'}).status_code, 404)
+
+
+class ChatWriteBehindTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+
+    def connect(self, user):
+        # channels.testing needs daphne, the plain ASGI communicator is enough here
+        return ApplicationCommunicator(ChatConsumer.as_asgi(), {'type': 'websocket', 'path': '/', 'user': user})
+
+    def test_broadcasts_and_saves_as_the_socket_user(self):
+        async def chat():
+            communicator = self.connect(self.alice)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+            self.assertEqual(json.loads((await communicator.receive_output())['text'])['type'], 'presence')
+            for i in range(3):
+                await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'message': f'hi {i}', 'username': 'mallory'})})
+            for i in range(3):
+                self.assertEqual(json.loads((await communicator.receive_output())['text']), {'message': f'hi {i}', 'username': 'alice'})
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait()
+
+        async_to_sync(chat)()
+        self.assertEqual(
+            list(Message.objects.order_by('pk').values_list('content', 'sender__username', 'room_name')),
+            [(f'hi {i}', 'alice', 'group_chat_gfg') for i in range(3)],
+        )
+
+    def test_anonymous_sockets_are_rejected(self):
+        async def chat():
+            communicator = self.connect(AnonymousUser())
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
+
+        async_to_sync(chat)()
+
+    def test_messages_are_written_in_batches(self):
+        writer = MessageWriter(batch_size=2, interval=0.05)
+
+        async def chat():
+            for i in range(5):
+                await writer.put(Message(sender=self.alice, content=f'hi {i}', room_name='group_chat_gfg'))
+            await writer.close()
+
+        with patch('chat.persistence.write_messages', wraps=write_messages) as write:
+            async_to_sync(chat)()
+        self.assertEqual([len(call.args[0]) for call in write.call_args_list], [2, 2, 1])
+        self.assertEqual(Message.objects.count(), 5)
+
+
+class PrivateChatConsumerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.carol = User.objects.create_user('carol', password='pw')
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.alice, cls.bob)
+
+    def connect(self, user):
+        return ApplicationCommunicator(PrivateChatConsumer.as_asgi(), {
+            'type': 'websocket',
+            'path': f'/private/{self.conversation.pk}/',
+            'user': user,
+            'url_route': {'args': (), 'kwargs': {'conversation_id': self.conversation.pk}},
+        })
+
+    def test_members_only_and_closed_on_delete(self):
+        async def chat():
+            outsider = self.connect(self.carol)
+            await outsider.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await outsider.receive_output())['type'], 'websocket.close')
+
+            communicator = self.connect(self.alice)
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+            self.assertEqual(json.loads((await communicator.receive_output())['text'])['type'], 'presence')
+            for i in range(2):
+                await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'message': f'hi {i}'})})
+                self.assertEqual(json.loads((await communicator.receive_output())['text'])['username'], 'alice')
+
+            await get_channel_layer().group_send(conversation_group(self.conversation.pk), {'type': 'conversation.deleted'})
+            self.assertEqual((await communicator.receive_output())['type'], 'websocket.close')
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait()
+
+        async_to_sync(chat)()
+        self.assertEqual(PrivateMessage.objects.filter(conversation=self.conversation, sender=self.alice).count(), 2)
+
+    def test_delete_chat_notifies_open_sockets(self):
+        self.client.force_login(self.alice)
+        with patch('chat.views.notify_conversation_deleted') as notify, self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('delete_chat', args=[self.conversation.pk]))
+        notify.assert_called_once_with(self.conversation.pk)
+        self.assertFalse(Conversation.objects.filter(pk=self.conversation.pk).exists())
+
+
+class NotificationPushTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        for user in (cls.alice, cls.bob):
+            Profile.objects.create(user=user)
+
+    def assign_and_read(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(user=self.alice, title='Write report', assigned_to=self.bob)
+        self.client.force_login(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('mark_notifications_as_read'))
+        return task
+
+    def test_assignment_and_read_are_pushed_to_the_assignee(self):
+        async def listen():
+            communicator = ApplicationCommunicator(NotificationConsumer.as_asgi(), {'type': 'websocket', 'path': '/notifications/', 'user': self.bob})
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+            task = await sync_to_async(self.assign_and_read)()
+
+            pushed = json.loads((await communicator.receive_output())['text'])
+            self.assertEqual(pushed['unread_delta'], 1)
+            self.assertEqual([n['message'] for n in pushed['notifications']], ['You have been assigned to: Write report'])
+            self.assertEqual(pushed['notifications'][0]['url'], reverse('update_task', args=[task.pk]))
+            self.assertEqual(json.loads((await communicator.receive_output())['text']), {'notifications': [], 'unread_delta': -1})
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait()
+
+        async_to_sync(listen)()
+
+
+class PresenceHubTests(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.hub = PresenceHub(presence_ttl=60, typing_ttl=3, clock=lambda: self.now)
+
+    def test_changes_are_coalesced_per_sender_and_expire(self):
+        self.hub.join('room', 'alice')
+        self.hub.join('room', 'bob')
+        self.hub.join('room', 'bob')  # second tab
+        for _ in range(100):
+            self.hub.typed('room', 'alice')
+        self.assertEqual(self.hub.drain(), {'room': {'alice': {'online': True, 'typing': True}, 'bob': {'online': True}}})
+        self.hub.typed('room', 'alice')
+        self.assertEqual(self.hub.drain(), {})
+
+        self.now = 4
+        self.assertEqual(self.hub.drain(), {'room': {'alice': {'typing': False}}})
+        self.hub.leave('room', 'bob')
+        self.assertEqual(self.hub.drain(), {})
+        self.hub.leave('room', 'bob')
+        self.assertEqual(self.hub.drain(), {'room': {'bob': {'online': False, 'typing': False}}})
+
+        # alice's socket stopped pinging
+        self.now = 61
+        self.assertEqual(self.hub.drain(), {'room': {'alice': {'online': False, 'typing': False}}})
+        self.hub.leave('room', 'alice')
+        self.hub.drain()
+        self.assertEqual(self.hub.rooms, {})
+
+    def test_expired_open_socket_comes_back_online(self):
+        self.hub.join('room', 'alice')
+        self.hub.drain()
+        self.now = 61
+        self.assertEqual(self.hub.drain(), {'room': {'alice': {'online': False, 'typing': False}}})
+        self.hub.touch('room', 'alice')
+        self.assertEqual(self.hub.drain(), {'room': {'alice': {'online': True}}})
+        self.assertEqual(self.hub.snapshot('room'), {'alice': {'online': True, 'typing': False}})
+
+        self.now = 200
+        self.hub.drain()
+        self.hub.typed('room', 'alice')
+        self.assertEqual(self.hub.drain(), {'room': {'alice': {'online': True, 'typing': True}}})
+
+    def test_one_event_per_group_per_flush(self):
+        async def fan_out():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add('room', channel)
+            for i in range(50):
+                self.hub.join('room', f'user{i}')
+                self.hub.typed('room', f'user{i}')
+            await self.hub.flush()
+            event = await layer.receive(channel)
+            self.assertEqual(event['type'], 'presence.changed')
+            self.assertEqual(len(event['changes']), 50)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(channel), 0.05)
 
-# Create your tests here.
+        async_to_sync(fan_out)()
@@ -5,7 +5,9 @@ from .views import private_chat_page, start_chat, inbox,delete_chat
 
 urlpatterns = [
     path("chat_home/", chat_views.chatPage, name="chatpage"),
+    path("chat_home/history/", chat_views.chat_history, name="chat-history"),
     path('private-chat/<int:conversation_id>/', private_chat_page, name='private-chat-page'),
+    path('private-chat/<int:conversation_id>/history/', chat_views.private_chat_history, name='private-chat-history'),
     path('start-chat/<int:user_id>/', start_chat, name='start-chat'),
     path('inbox/', inbox, name='inbox'),
     path('chat/delete_chat/<int:pk>/', delete_chat, name='delete_chat'),
@@ -1,40 +1,58 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from todo_project.models import Message, Conversation
 from django.contrib.auth.models import User
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from .consumers import notify_conversation_deleted
+from .history import history_window, serialize
+
+ROOM_NAME = "group_chat_gfg"
 
 
 def chatPage(request, *args, **kwargs):
-    print("Chat page view called")  # Debugging
     if not request.user.is_authenticated:
         return redirect("login-user")
 
-    # Fetch previous messages from the database
-    messages = Message.objects.filter(
-        room_name="group_chat_gfg").order_by('timestamp')
-    print(messages)  # Debugging
+    # Only the latest messages, older ones are loaded on demand from chat_history
+    messages, older = history_window(Message.objects.filter(room_name=ROOM_NAME))
 
     context = {
-        'messages': messages
+        'messages': messages,
+        'older': older,
     }
     return render(request, "chat/chatpage.html", context)
 
+
+@login_required
+def chat_history(request):
+    # "Load older" for the group chat: ?before=<cursor> from the page or the previous response
+    messages, older = history_window(Message.objects.filter(room_name=ROOM_NAME), request.GET.get('before'))
+    return JsonResponse({'messages': [serialize(message) for message in messages], 'older': older})
+
 @login_required
 def private_chat_page(request, conversation_id):
     
-    # Fetch the conversation and its messages
+    # Fetch the conversation and its latest messages
     conversation = Conversation.objects.get(id=conversation_id)
-    messages = conversation.messages.all().order_by('timestamp')
+    messages, older = history_window(conversation.messages.all())
 
     context = {
         'conversation': conversation,
-        'messages': messages
+        'messages': messages,
+        'older': older,
     }
     
     return render(request, "chat/private_chat.html", context)
 
 
+@login_required
+def private_chat_history(request, conversation_id):
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    messages, older = history_window(conversation.messages.all(), request.GET.get('before'))
+    return JsonResponse({'messages': [serialize(message) for message in messages], 'older': older})
+
+
 def start_chat(request, user_id):
     if not request.user.is_authenticated:
         return redirect('login-user')
@@ -70,7 +88,10 @@ def delete_chat(request, pk):
 
     # Ensure the user is a participant in the conversation
     if request.user in conversation.participants.all():
+        conversation_id = conversation.pk
         conversation.delete()
+        # Close the sockets still open on it
+        transaction.on_commit(lambda: notify_conversation_deleted(conversation_id))
         return redirect('inbox')
     else:
         return HttpResponseForbidden("You are not allowed to delete this conversation.")
@@ -56,8 +56,7 @@ class UserEditView(UpdateView):
 
     def get_object(self):
         # Get or create the profile instance for the current user
-        profile, created = Profile.objects.get_or_create(user=self.request.user)
-        return profile
+        return Profile.objects.for_user(self.request.user)
 
     def form_valid(self, form):
         # Save the profile form
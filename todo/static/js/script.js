@@ -33,6 +33,102 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+document.addEventListener('DOMContentLoaded', function() {
+    // Typeahead for the navbar search box, suggestions come from /search_task/suggest/
+    const searchInput = document.querySelector('[data-suggest-url]');
+    if (!searchInput) return;
+    const suggestions = document.getElementById('search-suggestions');
+    let timer = null;
+
+    searchInput.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = this.value.trim();
+        if (!query) {
+            suggestions.innerHTML = '';
+            return;
+        }
+        // Wait for a pause in typing before asking the server
+        timer = setTimeout(function() {
+            fetch(`${searchInput.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+            .then(response => response.json())
+            .then(data => {
+                suggestions.innerHTML = '';
+                data.results.forEach(function(result) {
+                    const option = document.createElement('option');
+                    option.value = result.label;
+                    suggestions.appendChild(option);
+                });
+            })
+            .catch(error => console.error('Error:', error));
+        }, 150);
+    });
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Live navbar notifications, pushed by NotificationConsumer
+    const badge = document.getElementById('notification-count');
+    if (!badge) return;
+    const headerCount = document.getElementById('notification-header-count');
+    const unreadList = document.getElementById('unread-notifications');
+    const scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    const socket = new WebSocket(scheme + window.location.host + '/notifications/');
+
+    socket.onmessage = function(event) {
+        const data = JSON.parse(event.data);
+        const count = Math.max(parseInt(badge.dataset.count || '0', 10) + data.unread_delta, 0);
+        badge.dataset.count = count;
+        badge.textContent = count;
+        badge.hidden = count === 0;
+        headerCount.textContent = count > 5 ? '5+' : count;
+
+        data.notifications.forEach(function(notification) {
+            const item = document.createElement('li');
+            item.className = 'notification-item';
+            const link = document.createElement('a');
+            link.className = 'd-flex align-items-center text-decoration-none';
+            link.href = notification.url || '#';
+            const text = document.createElement('p');
+            text.textContent = notification.message;
+            link.appendChild(text);
+            item.appendChild(link);
+            const divider = document.createElement('li');
+            divider.innerHTML = '<hr class="dropdown-divider">';
+            unreadList.after(item, divider);
+        });
+    };
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Patch task rows in place when a collaborator changes them, diffs come from TaskEventConsumer
+    if (!document.querySelector('.task-checkbox')) return;
+    const scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    const socket = new WebSocket(scheme + window.location.host + '/tasks/');
+
+    socket.onmessage = function(event) {
+        const data = JSON.parse(event.data);
+        data.tasks.forEach(function(diff) {
+            const row = document.getElementById(`task-${diff.id}`);
+            if (!row) return;
+            if (diff.deleted) {
+                row.remove();
+                return;
+            }
+            const fields = diff.fields;
+            if ('completed' in fields) {
+                row.querySelector('.task-checkbox').checked = fields.completed;
+            }
+            if ('title' in fields) {
+                row.querySelector('.a-list').textContent = fields.title;
+            }
+            if ('due_date' in fields && row.querySelector('.due-date')) {
+                row.querySelector('.due-date').textContent = fields.due_date ? new Date(fields.due_date).toLocaleDateString() : '';
+            }
+        });
+        // Pages with more to update (counters, charts) can listen for this
+        document.dispatchEvent(new CustomEvent('tasks:changed', { detail: data.tasks }));
+    };
+});
+
 document.addEventListener('DOMContentLoaded', function() {
     const logoutLink = document.getElementById('logout-link');
     if (logoutLink) {
@@ -6,6 +6,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todo.settings')
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter , URLRouter
 from chat import routing
+from chat.persistence import lifespan
 
 application = ProtocolTypeRouter(
     {
@@ -14,6 +15,8 @@ application = ProtocolTypeRouter(
             URLRouter(
                 routing.websocket_urlpatterns
             )    
-        )
+        ),
+        # Flushes the chat write-behind queue on shutdown
+        "lifespan" : lifespan,
     }
 )
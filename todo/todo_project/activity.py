@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ActivityLog
+
+
+# Rows per INSERT when a buffer is flushed, and the most rows a buffer holds before flushing early
+BATCH_SIZE = getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 500)
+
+_local = threading.local()
+
+
+def buffering_enabled():
+    # ACTIVITY_LOG_BUFFERED = False writes every entry straight away (handy in tests)
+    return getattr(settings, 'ACTIVITY_LOG_BUFFERED', True)
+
+
+def log_activity(**fields):
+    """
+    Record an ActivityLog entry.
+
+    Inside a buffered_activity() block the entry is queued and written with the
+    rest of the batch, otherwise it is saved right away like before.
+    """
+    entry = ActivityLog(**fields)
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        entry.save()
+        return entry
+
+    buffer.append(entry)
+    if len(buffer) >= BATCH_SIZE:
+        flush(buffer)
+    return entry
+
+
+def flush(buffer):
+    entries = buffer[:]
+    del buffer[:]
+    if entries:
+        ActivityLog.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+@contextmanager
+def buffered_activity():
+    """
+    Queue every log_activity() call made on this thread inside the block.
+
+    Whatever is left in the buffer is written with bulk_create when the surrounding
+    transaction commits (straight away in autocommit mode) and dropped if the block
+    raises or the transaction rolls back. Nested blocks share the outer buffer.
+    """
+    if not buffering_enabled() or getattr(_local, 'buffer', None) is not None:
+        yield
+        return
+
+    _local.buffer = buffer = []
+    try:
+        yield
+    finally:
+        _local.buffer = None
+    transaction.on_commit(lambda: flush(buffer))
+
+
+def buffer_activity(view):
+    """
+    Run a view in one transaction with its ActivityLog entries buffered.
+
+    Every entry the signal receivers log during the request is written with one
+    INSERT when the view's transaction commits, and neither the changes nor their
+    entries are kept if the view raises.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        with transaction.atomic(), buffered_activity():
+            return view(request, *args, **kwargs)
+    return wrapped
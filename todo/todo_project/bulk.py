@@ -0,0 +1,211 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Task, Comment, ActivityLog, Notification, Profile
+from .dashboard import invalidate_dashboard_stats
+from .realtime import push_notifications, push_task_diffs, task_diff
+from .search import remove_on_commit
+from .typeahead import invalidate_typeahead
+
+
+# How many tasks a bulk operation loads, deletes and logs per transaction
+CHUNK_SIZE = getattr(settings, 'TASK_BULK_CHUNK_SIZE', 1000)
+
+_local = threading.local()
+
+
+def in_bulk_operation():
+    """True while a bulk helper below is running on this thread and writes its own logs."""
+    return getattr(_local, 'active', False)
+
+
+@contextmanager
+def bulk_operation():
+    previous = in_bulk_operation()
+    _local.active = True
+    try:
+        yield
+    finally:
+        _local.active = previous
+
+
+def clear_completed_tasks(tasks=None, chunk_size=None):
+    """
+    Delete the completed tasks in `tasks` chunk by chunk and return how many were deleted.
+
+    Each chunk is one transaction: the ActivityLog rows are written with a single
+    bulk_create and the tasks (plus their cascades) with a single delete, so memory
+    stays bounded by the chunk size however many tasks there are. The per-row
+    post_delete logging and search index updates are skipped since they are done
+    here for the whole chunk.
+    """
+    tasks = Task.objects.all() if tasks is None else tasks
+    tasks = tasks.filter(completed=True).order_by('pk')
+    chunk_size = chunk_size or CHUNK_SIZE
+    deleted = 0
+
+    while True:
+        with transaction.atomic(), bulk_operation():
+            chunk = list(tasks.values('pk', 'title', 'user_id', 'assigned_to_id', 'user__username', 'assigned_to__username')[:chunk_size])
+            if not chunk:
+                break
+
+            ActivityLog.objects.bulk_create([
+                ActivityLog(
+                    user_id=row['user_id'],
+                    action='task_delete',
+                    object_id=row['pk'],
+                    details=f"Task '{row['title']}' was deleted by {row['assigned_to__username'] or row['user__username']}.",
+                )
+                for row in chunk
+            ])
+            task_ids = [row['pk'] for row in chunk]
+            comment_ids = list(Comment.objects.filter(post_id__in=task_ids).values_list('pk', flat=True))
+            Task.objects.filter(pk__in=task_ids).delete()
+            remove_on_commit('task', task_ids)
+            remove_on_commit('comment', comment_ids)
+            push_task_diffs([((row['user_id'], row['assigned_to_id']), task_diff(row['pk'], deleted=True)) for row in chunk])
+
+            affected = {row['user_id'] for row in chunk} | {row['assigned_to_id'] for row in chunk}
+            invalidate_dashboard_stats(*affected)
+            deleted += len(chunk)
+
+    return deleted
+
+
+def set_completed(user, updates):
+    """
+    Apply {task_id: completed} to the tasks `user` can see and return how many changed.
+
+    One SELECT for the current state, at most two UPDATEs (tasks being completed,
+    tasks being reopened) for the ones whose flag actually flips and one
+    bulk_create for their ActivityLog rows, however many tasks are sent. Unknown
+    or invisible task ids are ignored.
+    """
+    with transaction.atomic(), bulk_operation():
+        rows = list(
+            Task.objects.visible_to(user, pk__in=list(updates))
+            .values('pk', 'title', 'completed', 'user_id', 'assigned_to_id', 'user__username', 'assigned_to__username')
+        )
+        changed = [row for row in rows if row['completed'] != updates[row['pk']]]
+        if not changed:
+            return 0
+
+        for completed in (True, False):
+            pks = [row['pk'] for row in changed if updates[row['pk']] is completed]
+            if pks:
+                Task.objects.filter(pk__in=pks).update(completed=completed)
+        # Same entries as the post_save logging of a single checkbox
+        ActivityLog.objects.bulk_create([
+            ActivityLog(
+                user_id=row['assigned_to_id'] or row['user_id'],
+                action='task_complete' if updates[row['pk']] else 'task_update',
+                object_id=row['pk'],
+                details=f"Task '{row['title']}' was {'completed' if updates[row['pk']] else 'updated'} by {row['assigned_to__username'] or row['user__username']}.",
+            )
+            for row in changed
+        ])
+
+        push_task_diffs([
+            ((row['user_id'], row['assigned_to_id']), task_diff(row['pk'], {'completed': updates[row['pk']]}))
+            for row in changed
+        ])
+
+        affected = {row['user_id'] for row in changed} | {row['assigned_to_id'] for row in changed}
+        invalidate_dashboard_stats(*affected)
+        invalidate_typeahead(*affected)
+    return len(changed)
+
+
+# Bulk task operations and the Task field each one sets
+OPERATIONS = {
+    'reassign': 'assigned_to',
+    'recategorize': 'category',
+    'reprioritize': 'priority',
+    'bookmark': 'bookmarked',
+}
+
+
+def apply_operation(user, operation, task_ids, value):
+    """
+    Set one field on the tasks in `task_ids` that `user` owns or is assigned to.
+
+    `value` is validated by the model field (ValidationError if it doesn't fit, an
+    unknown user or category, a priority outside the choices...). Then it is one
+    SELECT, one UPDATE for the tasks that actually change, one ActivityLog
+    bulk_create and, for reassignments, one bulk_notify of the previous and new
+    assignees. Returns how many tasks changed.
+    """
+    field = Task._meta.get_field(OPERATIONS[operation])
+    value = field.clean(value, None)
+
+    with transaction.atomic(), bulk_operation():
+        rows = list(
+            Task.objects.visible_to(user, pk__in=task_ids)
+            .values('pk', 'title', 'user_id', 'assigned_to_id', field.attname)
+        )
+        changed = [row for row in rows if row[field.attname] != value]
+        if not changed:
+            return 0
+
+        Task.objects.filter(pk__in=[row['pk'] for row in changed]).update(**{field.attname: value})
+        ActivityLog.objects.bulk_create([
+            ActivityLog(
+                user_id=row['user_id'],
+                action='task_update',
+                object_id=row['pk'],
+                details=f"Task '{row['title']}' was updated by {user.username}. Changed: {field.verbose_name}.",
+            )
+            for row in changed
+        ])
+
+        # The new assignee of a reassignment hears about it too
+        push_task_diffs([
+            ((row['user_id'], row['assigned_to_id'], value if operation == 'reassign' else None), task_diff(row['pk'], {field.attname: value}))
+            for row in changed
+        ])
+
+        affected = {row['user_id'] for row in changed} | {row['assigned_to_id'] for row in changed}
+        if operation == 'reassign':
+            # Same messages as log_task_assignment sends for a single save
+            bulk_notify(
+                [
+                    Notification(user_id=row['assigned_to_id'], message=f"You have been unassigned from: '{row['title']}'", task_id=row['pk'])
+                    for row in changed if row['assigned_to_id']
+                ] + [
+                    Notification(user_id=value, message=f"You have been assigned to: '{row['title']}'", task_id=row['pk'])
+                    for row in changed if value
+                ]
+            )
+            affected.add(value)
+            invalidate_typeahead(*affected)
+        invalidate_dashboard_stats(*affected)
+    return len(changed)
+
+
+def bulk_notify(notifications):
+    """
+    Insert Notification objects with one bulk_create and bump the recipients' unread counters.
+
+    bulk_create skips post_save, so Profile.unread_notifications is updated here with
+    one F() update per distinct increment (usually just one), and the live navbar
+    update is sent with one event per recipient.
+    """
+    if not notifications:
+        return []
+    Notification.objects.bulk_create(notifications)
+
+    per_user = Counter(notification.user_id for notification in notifications if not notification.is_read)
+    users_by_increment = defaultdict(list)
+    for user_id, increment in per_user.items():
+        users_by_increment[increment].append(user_id)
+    for increment, user_ids in users_by_increment.items():
+        Profile.objects.filter(user_id__in=user_ids).update(
+            unread_notifications=F('unread_notifications') + increment)
+    push_notifications(notifications)
+    return notifications
@@ -1,22 +1,92 @@
 from .models import Profile, Category,Conversation,Notification, UserCategory
-from django.db.models import Max
-from django.db.models import Q
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.functional import SimpleLazyObject, cached_property
 
 
+NOTIFICATIONS_PER_GROUP = 5  # how many read/unread notifications the navbar dropdown shows
 
 
-def profile_context(request):              # this pulls the template globally. Context processors are good to be used when you want to pull info to all templates. :d 
+class GlobalContext:
+    """
+    Everything base.html pulls in on every page, computed at most once per request.
+
+    Each attribute is a cached_property so it only hits the database if a template
+    actually touches it, and every context processor below shares the same instance.
+    """
+
+    def __init__(self, request):
+        self.user = request.user
+
+    @classmethod
+    def for_request(cls, request):
+        if not hasattr(request, '_global_context'):
+            request._global_context = cls(request)
+        return request._global_context
+
+    @cached_property
+    def profile(self):
+        return Profile.objects.for_user(self.user)
+
+    @cached_property
+    def sidebar_categories(self):
+        # Fetch only categories marked by the user for their sidebar
+        categories = UserCategory.objects.filter(user=self.user).select_related('category')
+        return [user_category.category for user_category in categories]
+
+    @cached_property
+    def latest_conversations(self):
+        # Retrieve conversations for the logged-in user
+        return Conversation.objects.filter(participants=self.user)
+
+    @cached_property
+    def notifications(self):
+        # One query: the newest few of each read/unread group, split in Python
+        rows = list(
+            Notification.objects.filter(user=self.user)
+            .select_related('user__profile')
+            .annotate(
+                position=Window(RowNumber(), partition_by=[F('is_read')], order_by=F('timestamp').desc()),
+            )
+            .filter(position__lte=NOTIFICATIONS_PER_GROUP)
+            .order_by('-timestamp')
+        )
+        return {
+            'notifications_unread': [notification for notification in rows if not notification.is_read],
+            'notifications_read': [notification for notification in rows if notification.is_read],
+        }
+
+    @cached_property
+    def unread_count(self):
+        # Denormalized on the profile we load for the navbar anyway, so the badge is free
+        return self.profile.unread_notifications
+
+    def lazy(self, name, key=None):
+        if key is None:
+            return SimpleLazyObject(lambda: getattr(self, name))
+        return SimpleLazyObject(lambda: getattr(self, name)[key])
+
+
+def global_context(request):
+    """Single context processor for everything base.html needs."""
+    context = {}
+    for processor in (profile_context, sidebar_categories, latest_conversations, get_notifications):
+        context.update(processor(request))
+    return context
+
+
+# The processors below are kept so existing TEMPLATES settings keep working, they
+# all share the per-request GlobalContext so nothing is computed twice.
+
+def profile_context(request):              # this pulls the template globally. Context processors are good to be used when you want to pull info to all templates. :d
     if request.user.is_authenticated:
-        profile, created = Profile.objects.get_or_create(user=request.user)
-        return {'profile': profile}
+        return {'profile': GlobalContext.for_request(request).lazy('profile')}
     return {}
 
 
 def sidebar_categories(request):
     if request.user.is_authenticated:
-        # Fetch only categories marked by the user for their sidebar
-        categories = UserCategory.objects.filter(user=request.user).select_related('category')
-        return {'categoriess': [user_category.category for user_category in categories]}
+        return {'categoriess': GlobalContext.for_request(request).lazy('sidebar_categories')}
     else:
         return {'categoriess': []}  # No categories for unauthenticated users
 
@@ -25,26 +95,22 @@ def sidebar_categories(request):
 
 def latest_conversations(request):
     if request.user.is_authenticated:
-        # Retrieve conversations for the logged-in user
-        conversations = Conversation.objects.filter(participants=request.user)
         return {
-            'latest_conversations': conversations
+            'latest_conversations': GlobalContext.for_request(request).lazy('latest_conversations')
         }
     return {}
 
 
 def get_notifications(request):
     if request.user.is_authenticated:
-        notifications_unread = Notification.objects.filter(user=request.user, is_read=False).order_by('-timestamp')[:5]
-        notifications_read = Notification.objects.filter(user=request.user, is_read=True).order_by('-timestamp')[:5]
-        unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+        bundle = GlobalContext.for_request(request)
         return {
-            'notifications_unread': notifications_unread,
-            'notifications_read': notifications_read,
-            'unread_count': unread_count,
+            'notifications_unread': bundle.lazy('notifications', 'notifications_unread'),
+            'notifications_read': bundle.lazy('notifications', 'notifications_read'),
+            'unread_count': bundle.lazy('unread_count'),
         }
     return {
         'notifications_unread': [],
         'notifications_read': [],
         'unread_count': 0,
-    }
\ No newline at end of file
+    }
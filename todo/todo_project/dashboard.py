@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Task
+
+
+PRIORITIES = ['low', 'medium', 'high', 'urgent']
+CHART_DAYS = 8  # 8 to include today
+
+# Counters only change when a Task is saved or deleted (see signals.py), the
+# timeout is just a safety net for writes that bypass signals like .update()
+CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60 * 60)
+COMPLETED_COUNT_KEY = 'dashboard:completed_count'
+
+
+def user_stats_key(user_id, today):
+    # The date is part of the key since scheduled/overdue and the chart window roll over at midnight
+    return f'dashboard:{user_id}:{today.isoformat()}'
+
+
+def get_dashboard_stats(user, today=None):
+    """
+    Return every number the home page charts need for `user`.
+
+    Served from the cache when possible, so hot reads don't touch the Task table.
+    Returns the same keys TaskCountsMixin always exposed.
+    """
+    today = today or timezone.now().date()
+    key = user_stats_key(user.pk, today)
+    cached = cache.get_many([key, COMPLETED_COUNT_KEY])
+
+    stats = cached.get(key)
+    if stats is None:
+        stats = compute_user_stats(user, today)
+        cache.set(key, stats, CACHE_TIMEOUT)
+
+    completed_count = cached.get(COMPLETED_COUNT_KEY)
+    if completed_count is None:
+        # The completed card links to CompletedTaskListView, which isn't user scoped
+        completed_count = Task.objects.filter(completed=True).count()
+        cache.set(COMPLETED_COUNT_KEY, completed_count, CACHE_TIMEOUT)
+
+    return dict(stats, completed_tasks_count=completed_count)
+
+
+def invalidate_dashboard_stats(*user_ids):
+    """
+    Drop today's cached counters for the given users and the global completed count
+    once the transaction commits.
+
+    Dropping them earlier lets another request cache counts of the rows from
+    before the commit, which would then stay until CACHE_TIMEOUT.
+    """
+    today = timezone.now().date()
+    keys = [user_stats_key(user_id, today) for user_id in set(user_ids) if user_id]
+    transaction.on_commit(lambda: cache.delete_many(keys + [COMPLETED_COUNT_KEY]))
+
+
+def compute_user_stats(user, today):
+    """
+    Compute the user scoped series straight from the database.
+
+    Pie/card counts come from one conditional-aggregation query and the line
+    chart from one GROUP BY (priority, created_at) query.
+    """
+    start_date = today - timedelta(days=CHART_DAYS - 1)
+    visible = Task.objects.visible_to(user)
+
+    # Current counts for pie chart, all in one pass over the user's tasks
+    open_tasks = Q(completed=False)
+    counts = visible.aggregate(
+        all_tasks_count=Count('pk', filter=open_tasks),
+        recurring_tasks_count=Count('pk', filter=open_tasks & Q(recurring=True)),
+        scheduled_tasks_count=Count('pk', filter=open_tasks & Q(due_date__gte=today)),
+        overdue_tasks_count=Count('pk', filter=open_tasks & Q(due_date__lt=today)),
+        **{
+            f'{priority}_tasks_count': Count('pk', filter=open_tasks & Q(priority=priority))
+            for priority in PRIORITIES
+        }
+    )
+    stats = dict(counts)
+
+    # Data for the line chart: tasks created per day per priority
+    dates = [start_date + timedelta(days=i) for i in range(CHART_DAYS)]
+    priority_data = {priority: [0] * len(dates) for priority in PRIORITIES}
+    rows = (
+        Task.objects.visible_to(user, priority__in=PRIORITIES, created_at__gte=start_date, created_at__lte=today)
+        .values('priority', 'created_at')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    for row in rows:
+        priority_data[row['priority']][(row['created_at'] - start_date).days] = row['count']
+
+    for priority in PRIORITIES:
+        stats[f'{priority}_priority'] = priority_data[priority]
+    stats['dates'] = [date.strftime('%Y-%m-%dT%H:%M:%S.%fZ') for date in dates]
+    return stats
@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from todo_project.models import Task
+from todo_project.search import InvertedIndexBackend, get_search_backend, rebuild_index, search
+
+WORDS = ['report', 'invoice', 'meeting', 'review', 'deploy', 'budget', 'client', 'design', 'release', 'backup',
+         'email', 'call', 'draft', 'plan', 'test', 'fix', 'update', 'order', 'travel', 'renew']
+
+
+class Command(BaseCommand):
+    help = "Time the icontains scan against the full-text search backends on a synthetic table. Nothing is kept."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100_000, help="How many tasks to generate.")
+        parser.add_argument('--query', default='budget review', help="What to search for.")
+        parser.add_argument('--repeat', type=int, default=20, help="How many times each query is timed.")
+        parser.add_argument('--users', type=int, default=10, help="How many users the tasks are spread over, the first one searches.")
+
+    def handle(self, *args, **kwargs):
+        query = kwargs['query']
+        # Everything happens in one transaction that is rolled back at the end
+        with transaction.atomic():
+            user = self.seed(kwargs['tasks'], kwargs['users'])
+            backend = get_search_backend()
+            fallback = InvertedIndexBackend()
+            for name, candidate in {type(backend).__name__: backend, 'InvertedIndexBackend': fallback}.items():
+                started = time.perf_counter()
+                rebuild_index(candidate)
+                self.stdout.write(f'{name} built in {time.perf_counter() - started:.2f} s')
+
+            words = query.split()
+            icontains = Q()
+            for word in words:
+                icontains &= Q(title__icontains=word) | Q(description__icontains=word)
+            variants = {
+                'icontains': lambda: list(Task.objects.visible_to(user).filter(icontains)),
+                type(backend).__name__: lambda: search(user, query, backend),
+                'InvertedIndexBackend': lambda: search(user, query, fallback),
+            }
+            for name, run in variants.items():
+                started = time.perf_counter()
+                for _ in range(kwargs['repeat']):
+                    count = len(run())
+                elapsed = (time.perf_counter() - started) / kwargs['repeat']
+                self.stdout.write(self.style.SUCCESS(f'{name}: {count} results, {elapsed * 1000:.2f} ms per query'))
+            transaction.set_rollback(True)
+
+    def seed(self, tasks, users):
+        self.stdout.write(f'Generating {tasks} tasks for {users} users...')
+        # Most hits belong to someone else, as they would with a shared index
+        owners = [User.objects.create(username=f'bench-{time.time_ns()}-{i}') for i in range(max(users, 1))]
+        batch = []
+        for i in range(tasks):
+            batch.append(Task(
+                user=owners[i % len(owners)],
+                title=' '.join(random.sample(WORDS, 3)),
+                description=' '.join(random.choices(WORDS, k=20)),
+            ))
+            if len(batch) == 10_000:
+                Task.objects.bulk_create(batch)
+                batch = []
+        Task.objects.bulk_create(batch)
+        return owners[0]
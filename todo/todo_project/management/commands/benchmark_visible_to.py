@@ -0,0 +1,58 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from todo_project.models import Task
+
+class Command(BaseCommand):
+    help = "Compare the owner-or-assignee OR filter with Task.objects.visible_to() on a large synthetic table. Nothing is kept."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=1_000_000, help="How many tasks to generate.")
+        parser.add_argument('--users', type=int, default=1000, help="How many users to spread them over.")
+        parser.add_argument('--repeat', type=int, default=20, help="How many times each query is timed.")
+
+    def handle(self, *args, **kwargs):
+        # Everything happens in one transaction that is rolled back at the end
+        with transaction.atomic():
+            user = self.seed(kwargs['tasks'], kwargs['users'])
+            today = timezone.now().date()
+            variants = {
+                'OR filter': lambda: Task.objects.filter(Q(user=user) | Q(assigned_to=user), completed=False, due_date__lt=today),
+                'visible_to': lambda: Task.objects.visible_to(user, completed=False, due_date__lt=today),
+            }
+            for name, queryset in variants.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(queryset().explain())
+                started = time.perf_counter()
+                for _ in range(kwargs['repeat']):
+                    count = len(queryset())
+                elapsed = (time.perf_counter() - started) / kwargs['repeat']
+                self.stdout.write(self.style.SUCCESS(f'{count} rows, {elapsed * 1000:.2f} ms per query'))
+            transaction.set_rollback(True)
+
+    def seed(self, tasks, users):
+        self.stdout.write(f'Generating {tasks} tasks for {users} users...')
+        prefix = f'bench-{time.time_ns()}'
+        User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(users)])
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list('pk', flat=True))
+        today = timezone.now().date()
+        batch = []
+        for i in range(tasks):
+            batch.append(Task(
+                user_id=random.choice(user_ids),
+                assigned_to_id=random.choice(user_ids) if random.random() < 0.3 else None,
+                title=f'task {i}',
+                completed=random.random() < 0.5,
+                due_date=today + timedelta(days=random.randint(-60, 60)),
+            ))
+            if len(batch) == 10_000:
+                Task.objects.bulk_create(batch)
+                batch = []
+        Task.objects.bulk_create(batch)
+        return User(pk=user_ids[0])
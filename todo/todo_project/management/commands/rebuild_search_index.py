@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from todo_project.search import get_search_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of tasks, comments and chat messages from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows read and indexed per batch.")
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        self.stdout.write(f'Rebuilding the search index with {type(backend).__name__}...')
+        counts = rebuild_index(backend, batch_size=kwargs['batch_size'])
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'{sum(counts.values())} document(s) indexed.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from todo_project.models import Notification, Profile
+
+
+class Command(BaseCommand):
+    help = "Recount Profile.unread_notifications from the Notification table."
+
+    def handle(self, *args, **kwargs):
+        unread = (
+            Notification.objects.filter(user=OuterRef('user'), is_read=False)
+            .order_by().values('user').annotate(total=Count('pk')).values('total')
+        )
+        actual = Coalesce(Subquery(unread), 0)
+
+        # Only rewrite the profiles whose counter drifted (writes that skipped signals, admin edits...)
+        drifted = list(
+            Profile.objects.annotate(actual=actual)
+            .exclude(unread_notifications=F('actual'))
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            Profile.objects.filter(pk__in=drifted).update(unread_notifications=actual)
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread notification counts for {len(drifted)} profile(s).'))
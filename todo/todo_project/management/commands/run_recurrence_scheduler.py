@@ -0,0 +1,17 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from todo_project.scheduler import RecurrenceScheduler
+
+class Command(BaseCommand):
+    help = "Run the recurrence scheduler in the foreground, creating recurring tasks as they come due."
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("Recurrence scheduler started, press CTRL-C to stop.")
+        try:
+            asyncio.run(RecurrenceScheduler().run(on_created=self.report))
+        except KeyboardInterrupt:
+            self.stdout.write("Recurrence scheduler stopped.")
+
+    def report(self, created):
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} recurring task(s) created.'))
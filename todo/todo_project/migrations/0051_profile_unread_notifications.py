@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread_notifications(apps, schema_editor):
+    Profile = apps.get_model('todo_project', 'Profile')
+    Notification = apps.get_model('todo_project', 'Notification')
+    unread = (
+        Notification.objects.filter(user=OuterRef('user'), is_read=False)
+        .order_by().values('user').annotate(total=Count('pk')).values('total')
+    )
+    Profile.objects.update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_project', '0050_usercategory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_unread_notifications, migrations.RunPython.noop),
+    ]
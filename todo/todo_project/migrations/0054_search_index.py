@@ -0,0 +1,72 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+TABLE = 'todo_project_search_index'
+
+# Frozen copy of search.SOURCES: model -> (text fields, code used in document ids)
+SOURCES = {
+    'Task': (['title', 'description'], 1),
+    'Comment': (['body'], 2),
+    'Message': (['content'], 3),
+    'PrivateMessage': (['content'], 4),
+}
+BATCH_SIZE = 2000
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(f"CREATE VIRTUAL TABLE {TABLE} USING fts5(body, tokenize='unicode61 remove_diacritics 2')")
+        except OperationalError:
+            # SQLite built without FTS5, search falls back to the in-memory index
+            pass
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'CREATE TABLE {TABLE} (doc_id bigint PRIMARY KEY, document tsvector NOT NULL)')
+        schema_editor.execute(f'CREATE INDEX {TABLE}_gin ON {TABLE} USING GIN (document)')
+
+
+def fill_search_index(apps, schema_editor):
+    # Index what already exists, like `manage.py rebuild_search_index` does
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        if TABLE not in connection.introspection.table_names():
+            return
+        sql, config = f'INSERT INTO {TABLE} (rowid, body) VALUES (%s, %s)', []
+    elif connection.vendor == 'postgresql':
+        sql = f'INSERT INTO {TABLE} (doc_id, document) VALUES (%s, to_tsvector(%s, %s))'
+        config = [getattr(settings, 'SEARCH_TS_CONFIG', 'simple')]
+    else:
+        return
+    for name, (fields, code) in SOURCES.items():
+        model = apps.get_model('todo_project', name)
+        rows = model.objects.order_by('pk').values_list('pk', *fields).iterator(chunk_size=BATCH_SIZE)
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(islice(rows, BATCH_SIZE))
+                if not batch:
+                    break
+                cursor.executemany(sql, [
+                    (pk * 8 + code, *config, ' '.join(value or '' for value in values)) for pk, *values in batch
+                ])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_project', '0053_task_access_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
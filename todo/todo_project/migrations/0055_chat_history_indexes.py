@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_project', '0054_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room_name', 'timestamp', 'id'], name='message_room_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='privatemessage_conv_ts_idx'),
+        ),
+    ]
@@ -21,13 +21,81 @@ class UserCategory(models.Model):
         unique_together = ('user', 'category')  # Ensure each user can only add a category once
 
 
+class FieldTrackerMixin:
+    """
+    Remembers the values a row was loaded with so signal receivers can see what a save changed.
+
+    post_save receivers run before the snapshot is refreshed, so `changed_fields()` in there
+    describes the save in progress without another SELECT.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _current_values(self):
+        deferred = self.get_deferred_fields()
+        return {
+            field.attname: field.value_from_object(self)
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+        }
+
+    def changed_fields(self):
+        """Return {attname: (old, new)} for fields that differ from the loaded row. Empty for new objects."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {}
+        current = self._current_values()
+        return {
+            name: (old, current[name])
+            for name, old in loaded.items()
+            if name in current and current[name] != old
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = self._current_values()
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        # The reloaded values are what the row holds now (also runs when a deferred field is loaded)
+        current = self._current_values()
+        if fields is None or getattr(self, '_loaded_values', None) is None:
+            self._loaded_values = current
+            return
+        for name in fields:
+            attname = getattr(self._meta.get_field(name), 'attname', None)
+            if attname in current:
+                self._loaded_values[attname] = current[attname]
+
+
 def one_week_hence():
     return datetime.now() + timedelta(weeks=1)
 
 
 
 
-class Task(models.Model):
+class TaskQuerySet(models.QuerySet):
+    def visible_to(self, user, *args, **kwargs):
+        """
+        Tasks created by or assigned to `user`, the same rows as
+        filter(Q(user=user) | Q(assigned_to=user), *args, **kwargs).
+
+        Compiled as `id IN (owner branch UNION ALL assignee branch)` with the extra
+        filters pushed into both branches, so each side seeks its own index instead
+        of the planner facing an OR across two columns. The assignee branch skips
+        the user's own tasks, so the branches never overlap.
+        """
+        tasks = self.model._default_manager
+        owned = tasks.filter(*args, user=user, **kwargs).values('pk')
+        assigned = tasks.filter(*args, assigned_to=user, **kwargs).exclude(user=user).values('pk')
+        return self.filter(pk__in=owned.union(assigned, all=True))
+
+
+class Task(FieldTrackerMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE) # on_delete=models.Cascade - When delete the post delete the associated user too from the database
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -59,10 +127,52 @@ class Task(models.Model):
     
     recurring_interval = models.CharField(max_length=10, choices=RECURRING_CHOICES, blank=True, null=True)
 
-    
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        # The views filter on (user OR assigned_to) plus completed/due_date, so both sides get an index.
+        # Booleans go in partial index conditions, `NOT completed` can't seek a composite index on SQLite
+        indexes = [
+            models.Index(fields=['user', 'due_date'], condition=models.Q(completed=False), name='task_user_open_due_idx'),
+            models.Index(fields=['assigned_to', 'due_date'], condition=models.Q(completed=False), name='task_assignee_open_due_idx'),
+            models.Index(fields=['user', 'created_at'], name='task_user_created_idx'),
+            models.Index(fields=['parent_task', 'due_date'], name='task_parent_due_idx'),
+            models.Index(fields=['user'], condition=models.Q(recurring=True, completed=False), name='task_user_recurring_idx'),
+            models.Index(fields=['user'], condition=models.Q(bookmarked=True), name='task_user_bookmarked_idx'),
+            models.Index(fields=['id'], condition=models.Q(completed=True), name='task_completed_idx'),
+        ]
+
     def __str__(self):
         return self.title + ''
 
+class TaskOccurrence(models.Model):
+    # Upcoming dates of a recurring task, kept for a rolling horizon by recurrence.py so
+    # calendar style pages can show them without creating a Task clone for each one
+    task = models.ForeignKey(Task, related_name='occurrences', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('task', 'date')
+        indexes = [models.Index(fields=['user', 'date'])]
+
+    def __str__(self):
+        return f"{self.task.title} on {self.date}"
+
+class ProfileQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        The user's profile, created on first use.
+
+        A new profile starts with the notifications the user already has, the
+        signals only keep existing counters in step.
+        """
+        profile, created = self.get_or_create(user=user, defaults={
+            'unread_notifications': lambda: Notification.objects.filter(user=user, is_read=False).count(),
+        })
+        return profile
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User,null=True, on_delete=models.CASCADE)
     username = models.CharField(max_length=100, blank=True)
@@ -77,6 +187,9 @@ class Profile(models.Model):
     instagram_profile = models.CharField(max_length=100, blank=True, null=True)
     linkedin_profile = models.CharField(max_length=100, blank=True, null=True)
     facebook_profile = models.CharField(max_length=100, blank=True, null=True)
+    unread_notifications = models.PositiveIntegerField(default=0)  # Denormalized for the navbar badge, see signals.py
+
+    objects = ProfileQuerySet.as_manager()
     
     
     
@@ -109,6 +222,10 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     room_name = models.CharField(max_length=100)
 
+    class Meta:
+        # Chat history pages walk a room backwards on (timestamp, id)
+        indexes = [models.Index(fields=['room_name', 'timestamp', 'id'], name='message_room_ts_idx')]
+
     def __str__(self):
         return f"{self.sender.username}: {self.content[:20]}"
     
@@ -118,6 +235,9 @@ class PrivateMessage(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['conversation', 'timestamp', 'id'], name='privatemessage_conv_ts_idx')]
+
     def __str__(self):
         return f"{self.sender.username}: {self.content} at {self.timestamp}"
     
@@ -137,6 +257,9 @@ class ActivityLog(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     details = models.TextField(blank=True, null=True)  # Optional details
 
+    class Meta:
+        indexes = [models.Index(fields=['user', '-timestamp'], name='activity_user_ts_idx')]
+
     def __str__(self):
         return f"{self.user} {self.get_action_display()} at {self.timestamp}"
     
@@ -150,6 +273,12 @@ class Notification(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     task = models.ForeignKey(Task, null=True, blank=True, on_delete=models.SET_NULL)  # Optional field for task
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-timestamp'], name='notification_user_ts_idx'),
+            models.Index(fields=['user', '-timestamp'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
+
     
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message}"
\ No newline at end of file
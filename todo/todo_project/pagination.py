@@ -0,0 +1,122 @@
+from django.db.models import F, Q
+from django.http import Http404, JsonResponse
+from django.utils.functional import cached_property
+
+
+def encode_cursor(obj, field):
+    """Cursor pointing just past `obj` in an ordering on (field, pk): "<iso value or empty>:<pk>"."""
+    value = getattr(obj, field)
+    return f"{value.isoformat() if value is not None else ''}:{obj.pk}"
+
+
+def cursor_filter(model, field, cursor, descending=False):
+    """
+    Q matching the rows after `cursor` in an ordering on (field, pk) with NULLs last.
+
+    Raises Http404 for cursors that don't parse, they only come from tampered URLs.
+    """
+    after = 'lt' if descending else 'gt'
+    model_field = model._meta.get_field(field)
+    try:
+        raw_value, raw_pk = cursor.rsplit(':', 1)
+        value = model_field.to_python(raw_value) if raw_value else None
+        pk = int(raw_pk)
+    except Exception:
+        raise Http404("Invalid cursor.")
+
+    if value is None:
+        # Already in the NULLs at the end, only the id moves forward
+        return Q(**{f'{field}__isnull': True, f'pk__{after}': pk})
+    condition = Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'pk__{after}': pk})
+    if model_field.null:
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+class KeysetPage:
+    """
+    One page of a keyset paginated queryset, fetched lazily on first use.
+
+    Fetches page_size + 1 rows to know whether there is a next page, and exposes
+    the cursor of the last row so the next page can continue right after it.
+    """
+
+    def __init__(self, queryset, page_size, keyset):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.keyset = keyset
+
+    @cached_property
+    def _rows(self):
+        return list(self.queryset[:self.page_size + 1])
+
+    @property
+    def object_list(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def has_next(self):
+        return len(self._rows) > self.page_size
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor(self.object_list[-1], self.keyset)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for ListViews, ordered on (keyset, id) with NULLs last.
+
+    `?after=<cursor>` continues after the last row of the previous page with an
+    indexed range condition instead of OFFSET, so page N costs the same as page 1.
+    `?format=json` returns the page as JSON for "load more" buttons.
+    """
+    paginate_by = 50
+    keyset = 'due_date'
+    keyset_descending = False
+    cursor_param = 'after'
+
+    def paginate_queryset(self, queryset, page_size):
+        field, descending = self.keyset, self.keyset_descending
+        ordering = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        queryset = queryset.order_by(ordering, '-pk' if descending else 'pk')
+
+        cursor = self.request.GET.get(self.cursor_param)
+        if cursor:
+            queryset = queryset.filter(self.after_cursor(queryset.model, cursor))
+
+        page = KeysetPage(queryset, page_size, field)
+        return (None, page, page, True)
+
+    def after_cursor(self, model, cursor):
+        return cursor_filter(model, self.keyset, cursor, self.keyset_descending)
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            page = context['page_obj']
+            return JsonResponse({
+                'results': [self.serialize(obj) for obj in page],
+                'next': page.next_cursor,
+            })
+        return super().render_to_response(context, **response_kwargs)
+
+    def serialize(self, task):
+        return {
+            'id': task.pk,
+            'title': task.title,
+            'completed': task.completed,
+            'due_date': task.due_date,
+            'priority': task.priority,
+            'category_id': task.category_id,
+        }
@@ -0,0 +1,124 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import date
+
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.urls import reverse
+
+
+logger = logging.getLogger(__name__)
+
+
+def notification_group(user_id):
+    """Channel layer group of every open NotificationConsumer socket of one user."""
+    return f'notifications_{user_id}'
+
+
+def group_send(group, event):
+    # Live updates are best effort, the next page render shows the same thing
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group, event)
+    except ChannelFull:
+        logger.warning("Channel layer is full, dropped %s for %s", event['type'], group)
+    except Exception:
+        # Runs in on_commit, raising would turn an already committed save into an error page
+        logger.exception("Could not send %s to %s", event['type'], group)
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.pk,
+        'message': notification.message,
+        'task_id': notification.task_id,
+        'url': reverse('update_task', args=[notification.task_id]) if notification.task_id else None,
+        'timestamp': notification.timestamp.isoformat() if notification.timestamp else None,
+    }
+
+
+def push_notifications(notifications):
+    """
+    Send newly created notifications to their users once the transaction commits.
+
+    One event per user however many notifications they got, carrying the rows and
+    how much their unread count went up.
+    """
+    per_user = defaultdict(list)
+    for notification in notifications:
+        per_user[notification.user_id].append(serialize_notification(notification))
+    unread = Counter(notification.user_id for notification in notifications if not notification.is_read)
+    if per_user:
+        transaction.on_commit(lambda: send_notifications(per_user, unread))
+
+
+def send_notifications(per_user, unread):
+    for user_id, rows in per_user.items():
+        group_send(notification_group(user_id), {
+            'type': 'notifications.push',
+            'notifications': rows,
+            'unread_delta': unread[user_id],
+        })
+
+
+def push_unread_delta(user_id, delta):
+    """Unread count changes without new rows: marked as read, deleted..."""
+    if delta:
+        transaction.on_commit(lambda: group_send(notification_group(user_id), {
+            'type': 'notifications.push',
+            'notifications': [],
+            'unread_delta': delta,
+        }))
+
+
+# What task diffs carry, enough for a list page to render or patch the row
+TASK_FIELDS = ['title', 'completed', 'due_date', 'priority', 'category_id', 'assigned_to_id', 'bookmarked']
+
+
+def task_group(user_id):
+    """Channel layer group of every open TaskEventConsumer socket of one user."""
+    return f'tasks_{user_id}'
+
+
+def plain(value):
+    # Channel layers serialize with msgpack, which has no dates
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def task_diff(task_id, fields=None, created=False, deleted=False):
+    """{'id', 'fields': {attname: new value}} for a change, {'id', 'deleted': True} for a delete."""
+    if deleted:
+        return {'id': task_id, 'deleted': True}
+    diff = {'id': task_id, 'fields': {name: plain(value) for name, value in fields.items()}}
+    if created:
+        diff['created'] = True
+    return diff
+
+
+def created_task_diff(task):
+    return task_diff(task.pk, {name: getattr(task, name) for name in TASK_FIELDS}, created=True)
+
+
+def push_task_diffs(diffs):
+    """
+    Send [(recipient user ids, diff)] to the recipients' task groups once the transaction commits.
+
+    Diffs are grouped per recipient, so a bulk operation over many tasks is still
+    one event per user.
+    """
+    per_user = defaultdict(list)
+    for user_ids, diff in diffs:
+        for user_id in set(user_ids):
+            if user_id:
+                per_user[user_id].append(diff)
+    if per_user:
+        transaction.on_commit(lambda: send_task_diffs(per_user))
+
+
+def send_task_diffs(per_user):
+    for user_id, diffs in per_user.items():
+        group_send(task_group(user_id), {'type': 'tasks.changed', 'tasks': diffs})
@@ -0,0 +1,226 @@
+import calendar
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task, TaskOccurrence, ActivityLog, Notification
+from .bulk import bulk_notify
+from .dashboard import invalidate_dashboard_stats
+from .realtime import created_task_diff, push_task_diffs
+from .search import index_on_commit
+from .typeahead import invalidate_typeahead
+
+
+# How many recurring templates are read and cloned per transaction
+CHUNK_SIZE = getattr(settings, 'RECURRENCE_CHUNK_SIZE', 2000)
+
+# How far ahead the TaskOccurrence index is kept
+HORIZON_DAYS = getattr(settings, 'RECURRENCE_HORIZON_DAYS', 90)
+
+# Fields copied from a template onto every occurrence
+CLONED_FIELDS = ['user_id', 'title', 'description', 'assigned_to_id', 'category_id', 'priority', 'file', 'bookmarked']
+
+
+def add_months(date, months):
+    """Calendar month arithmetic, clamping to the last day (Jan 31 + 1 month = Feb 28/29)."""
+    month_index = date.month - 1 + months
+    year, month = date.year + month_index // 12, month_index % 12 + 1
+    return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
+
+
+def nth_occurrence(anchor, interval, n):
+    # Always count from the anchor so monthly dates don't drift after a short month
+    if interval == 'monthly':
+        return add_months(anchor, n)
+    if interval == 'weekly':
+        return anchor + timedelta(weeks=n)
+    # 'daily', and 'minute' since due dates are plain dates, a day is the smallest step they can take
+    return anchor + timedelta(days=n)
+
+
+def next_occurrence(task, on_or_after):
+    """
+    First occurrence of a recurring task due on or after `on_or_after`, or None.
+
+    Occurrences are the template's due_date plus whole intervals, limited to the
+    recurring_start_date/recurring_end_date window when those are set.
+    """
+    anchor = task.due_date
+    if anchor is None or task.recurring_interval is None:
+        return None
+    if task.recurring_start_date and task.recurring_start_date > on_or_after:
+        on_or_after = task.recurring_start_date
+
+    # Jump close to the target then step forward, it's O(1) however far behind the template is
+    days = (on_or_after - anchor).days
+    if task.recurring_interval == 'monthly':
+        n = max(1, (on_or_after.year - anchor.year) * 12 + on_or_after.month - anchor.month)
+    elif task.recurring_interval == 'weekly':
+        n = max(1, -(-days // 7))
+    else:
+        n = max(1, days)
+    occurrence = nth_occurrence(anchor, task.recurring_interval, n)
+    while occurrence < on_or_after:
+        n += 1
+        occurrence = nth_occurrence(anchor, task.recurring_interval, n)
+
+    if task.recurring_end_date and occurrence > task.recurring_end_date:
+        return None
+    return occurrence
+
+
+def recurring_templates(today):
+    """Recurring tasks that still produce occurrences. Clones point at their template via parent_task."""
+    return Task.objects.filter(
+        Q(recurring_end_date__isnull=True) | Q(recurring_end_date__gte=today),
+        recurring=True,
+        parent_task__isnull=True,
+        due_date__isnull=False,
+        recurring_interval__isnull=False,
+    )
+
+
+def is_template(task, today):
+    # Same conditions as recurring_templates(), for a task already in memory
+    return (
+        task.recurring and task.parent_task_id is None
+        and task.due_date is not None and task.recurring_interval is not None
+        and (task.recurring_end_date is None or task.recurring_end_date >= today)
+    )
+
+
+def occurrences_between(task, start, end):
+    """Every occurrence of a recurring task from `start` to `end` inclusive."""
+    occurrences = []
+    occurrence = next_occurrence(task, start)
+    while occurrence is not None and occurrence <= end:
+        occurrences.append(occurrence)
+        occurrence = next_occurrence(task, occurrence + timedelta(days=1))
+    return occurrences
+
+
+def index_occurrences(templates, today):
+    """
+    Rewrite the TaskOccurrence rows of `templates` for today up to the horizon.
+
+    One delete and one bulk_create whatever the batch size. Tasks that stopped
+    being templates just lose their rows.
+    """
+    end = today + timedelta(days=HORIZON_DAYS)
+    TaskOccurrence.objects.filter(task__in=[template.pk for template in templates]).delete()
+    TaskOccurrence.objects.bulk_create([
+        TaskOccurrence(task_id=template.pk, user_id=template.user_id, date=date)
+        for template in templates
+        if is_template(template, today)
+        for date in occurrences_between(template, today, end)
+    ])
+
+
+def reindex_template(task_id, today=None):
+    """Refresh the occurrence index of one task after it was edited."""
+    today = today or timezone.localdate()
+    task = Task.objects.filter(pk=task_id).first()
+    if task is not None:
+        index_occurrences([task], today)
+
+
+def clone(template, due_date):
+    task = Task(
+        due_date=due_date,
+        recurring=True,  # Clones stay recurring so they show up in the recurring list
+        parent_task_id=template.pk,
+    )
+    for field in CLONED_FIELDS:
+        setattr(task, field, getattr(template, field))
+    return task
+
+
+def upcoming_occurrences(templates, today):
+    """
+    ({template id: (template, upcoming due date)}, {(template id, due date) already cloned}).
+
+    One query for the existing clones of the whole batch, templates without an
+    upcoming occurrence are left out.
+    """
+    candidates = {}
+    for template in templates:
+        due_date = next_occurrence(template, today)
+        if due_date is not None:
+            candidates[template.pk] = (template, due_date)
+    if not candidates:
+        return candidates, set()
+
+    existing = set(
+        Task.objects.filter(
+            parent_task_id__in=candidates,
+            due_date__in={due_date for _, due_date in candidates.values()},
+        ).values_list('parent_task_id', 'due_date')
+    )
+    return candidates, existing
+
+
+def materialize_occurrences(templates, today):
+    """
+    Create the upcoming occurrence of each template unless it already exists.
+
+    Templates are handled as one batch: one query for the existing clones, one
+    bulk_create for the new ones and one each for their activity entries and
+    assignment notifications. Returns the created tasks.
+    """
+    candidates, existing = upcoming_occurrences(templates, today)
+    clones = [
+        clone(template, due_date)
+        for template_id, (template, due_date) in candidates.items()
+        if (template_id, due_date) not in existing
+    ]
+    if not clones:
+        return []
+
+    Task.objects.bulk_create(clones)
+    ActivityLog.objects.bulk_create([
+        ActivityLog(
+            user_id=task.user_id,
+            action='task_add',
+            object_id=task.pk,
+            details=f"Task '{task.title}' was added by the recurrence scheduler.",
+        )
+        for task in clones
+    ])
+    bulk_notify([
+        Notification(user_id=task.assigned_to_id, message=f"You have been assigned to: {task.title}", task=task)
+        for task in clones
+        if task.assigned_to_id
+    ])
+    invalidate_dashboard_stats(*{task.user_id for task in clones}, *{task.assigned_to_id for task in clones})
+    invalidate_typeahead(*{task.user_id for task in clones}, *{task.assigned_to_id for task in clones})
+    # bulk_create skips post_save, so the clones are indexed for search and pushed to open lists here
+    index_on_commit(clones)
+    push_task_diffs([((task.user_id, task.assigned_to_id), created_task_diff(task)) for task in clones])
+    return clones
+
+
+def materialize_recurring_tasks(today=None, chunk_size=None):
+    """
+    Walk every recurring template in chunks, materialize what is due and roll the
+    occurrence index forward. Returns how many tasks were created.
+    """
+    today = today or timezone.localdate()
+    chunk_size = chunk_size or CHUNK_SIZE
+    # Drop index rows that fell behind today or belong to tasks that stopped recurring
+    TaskOccurrence.objects.filter(
+        Q(date__lt=today) | ~Q(task__in=recurring_templates(today))
+    ).delete()
+
+    templates = recurring_templates(today).order_by('pk').iterator(chunk_size=chunk_size)
+    created = 0
+    while True:
+        chunk = list(islice(templates, chunk_size))
+        if not chunk:
+            return created
+        with transaction.atomic():
+            created += len(materialize_occurrences(chunk, today))
+            index_occurrences(chunk, today)
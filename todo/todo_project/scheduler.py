@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .realtime import group_send
+from .recurrence import CHUNK_SIZE, recurring_templates, materialize_occurrences, next_occurrence, index_occurrences, upcoming_occurrences
+
+
+# Running schedulers join this group, task signals send {'type': 'task.changed', 'task_id': ...} to it
+GROUP = 'recurrence-scheduler'
+# Full reload every so often, in case a change notification got lost (layer down, channel full...)
+RESCAN_INTERVAL = getattr(settings, 'RECURRENCE_SCHEDULER_RESCAN', 60 * 60)
+
+
+def notify_scheduler(task_id):
+    """
+    Tell running schedulers that a recurring task changed.
+
+    Best effort like every other push: nothing is queued when no scheduler is
+    running, and a lost notification is picked up by the next rescan.
+    """
+    group_send(GROUP, {'type': 'task.changed', 'task_id': task_id})
+
+
+class RecurrenceScheduler:
+    """
+    Keeps the next materialization date of every recurring template in a heap.
+
+    The heap holds (due date, template id) pairs and `due` maps each template to its
+    current entry, so changed templates are rescheduled by pushing a new entry and
+    leaving the old one to be skipped when it surfaces. Each occurrence costs
+    O(log n) instead of a table scan per tick.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.due = {}
+
+    def schedule(self, template_id, when):
+        self.due[template_id] = when
+        heapq.heappush(self.heap, (when, template_id))
+
+    def unschedule(self, template_id):
+        self.due.pop(template_id, None)
+
+    def load(self, today=None):
+        """
+        Rebuild the heap from the database, each template at the date it next has work.
+
+        That is today when its upcoming occurrence wasn't created yet (a new template,
+        or the scheduler was down) and the day after that occurrence otherwise, like
+        run_due() schedules it. A rescan only reads templates and their clones.
+        """
+        today = today or timezone.localdate()
+        self.heap, self.due = [], {}
+        templates = recurring_templates(today).only(
+            'due_date', 'recurring_interval', 'recurring_start_date', 'recurring_end_date',
+        ).order_by('pk').iterator(chunk_size=CHUNK_SIZE)
+        while True:
+            chunk = list(islice(templates, CHUNK_SIZE))
+            if not chunk:
+                return
+            candidates, existing = upcoming_occurrences(chunk, today)
+            for template_id, (template, due_date) in candidates.items():
+                if (template_id, due_date) in existing:
+                    self.schedule(template_id, due_date + timedelta(days=1))
+                else:
+                    self.schedule(template_id, today)
+
+    def refresh(self, task_id, today=None):
+        """Reschedule one task after a change, dropping it if it is no longer a live template."""
+        today = today or timezone.localdate()
+        if recurring_templates(today).filter(pk=task_id).exists():
+            self.schedule(task_id, today)
+        else:
+            self.unschedule(task_id)
+
+    def next_due(self):
+        # Discard entries that were superseded by a reschedule
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def run_due(self, today=None):
+        """Materialize every template due by `today` and reschedule it. Returns the created tasks."""
+        today = today or timezone.localdate()
+        template_ids = []
+        while self.next_due() is not None and self.next_due() <= today:
+            when, template_id = heapq.heappop(self.heap)
+            del self.due[template_id]
+            template_ids.append(template_id)
+        if not template_ids:
+            return []
+
+        created = []
+        for start in range(0, len(template_ids), CHUNK_SIZE):
+            templates = list(recurring_templates(today).filter(pk__in=template_ids[start:start + CHUNK_SIZE]))
+            with transaction.atomic():
+                created += materialize_occurrences(templates, today)
+                index_occurrences(templates, today)
+            for template in templates:
+                occurrence = next_occurrence(template, today)
+                if occurrence is not None:
+                    # The following occurrence becomes the upcoming one the day after this one is due
+                    self.schedule(template.pk, occurrence + timedelta(days=1))
+        return created
+
+    def seconds_until_next(self):
+        when = self.next_due()
+        if when is None:
+            return RESCAN_INTERVAL
+        wake_at = timezone.make_aware(datetime.combine(when, time.min))
+        return min(max((wake_at - timezone.now()).total_seconds(), 0), RESCAN_INTERVAL)
+
+    async def join(self, channel_layer, channel):
+        # Renewed on every rescan, layers expire group memberships after a while
+        if channel_layer is not None:
+            await channel_layer.group_add(GROUP, channel)
+
+    async def run(self, on_created=None):
+        """Sleep until the earliest template is due or a change arrives through GROUP, forever."""
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel() if channel_layer is not None else None
+        try:
+            await self.join(channel_layer, channel)
+            await sync_to_async(self.load)()
+            last_scan = timezone.now()
+            while True:
+                if (timezone.now() - last_scan).total_seconds() >= RESCAN_INTERVAL:
+                    await self.join(channel_layer, channel)
+                    await sync_to_async(self.load)()
+                    last_scan = timezone.now()
+                await self.wait(channel_layer, channel, on_created)
+        finally:
+            if channel_layer is not None:
+                await channel_layer.group_discard(GROUP, channel)
+
+    async def wait(self, channel_layer, channel, on_created):
+        timeout = self.seconds_until_next()
+        try:
+            if channel_layer is None:
+                await asyncio.sleep(timeout)
+                raise asyncio.TimeoutError
+            message = await asyncio.wait_for(channel_layer.receive(channel), timeout)
+        except asyncio.TimeoutError:
+            created = await sync_to_async(self.run_due)()
+            if created and on_created:
+                on_created(created)
+        else:
+            if message.get('type') == 'task.changed':
+                await sync_to_async(self.refresh)(message['task_id'])
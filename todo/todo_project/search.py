@@ -0,0 +1,367 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from .models import Task, Comment, Message, PrivateMessage
+
+
+# Ranked hits fetched per query, results are paginated out of these
+MAX_HITS = getattr(settings, 'SEARCH_MAX_HITS', 1000)
+
+# Rows read and written per batch when rebuilding the index
+BATCH_SIZE = getattr(settings, 'SEARCH_BATCH_SIZE', 2000)
+
+# Text search configuration of the PostgreSQL backend
+TS_CONFIG = getattr(settings, 'SEARCH_TS_CONFIG', 'simple')
+
+# Table of the FTS5 and PostgreSQL backends, created by migration 0054
+TABLE = 'todo_project_search_index'
+
+# What gets indexed: kind -> (model, text fields, code used in document ids)
+SOURCES = {
+    'task': (Task, ['title', 'description'], 1),
+    'comment': (Comment, ['body'], 2),
+    'message': (Message, ['content'], 3),
+    'private_message': (PrivateMessage, ['content'], 4),
+}
+KINDS = {model: kind for kind, (model, _, _) in SOURCES.items()}
+CODES = {code: kind for kind, (_, _, code) in SOURCES.items()}
+
+# Same split as the FTS5 unicode61 tokenizer: runs of letters and digits, lowercased
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+SearchResult = namedtuple('SearchResult', ['kind', 'object', 'score'])
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def doc_id(kind, pk):
+    # One integer key per document so the SQL backends update rows by primary key
+    return pk * 8 + SOURCES[kind][2]
+
+
+def parse_doc_id(value):
+    return CODES[value % 8], value // 8
+
+
+def visible_scope(user):
+    """
+    {kind: queryset of the pks `user` may see} for the backends, None for kinds everybody sees.
+
+    Backends rank within this scope, so hits of other users never take the places
+    of the user's own results.
+    """
+    tasks = Task.objects.visible_to(user)
+    return {
+        'task': tasks.values('pk'),
+        'comment': Comment.objects.filter(post__in=tasks).values('pk'),
+        'message': None,
+        'private_message': PrivateMessage.objects.filter(conversation__participants=user).values('pk'),
+    }
+
+
+def scope_sql(scope, column):
+    """WHERE condition on the doc_id `column` keeping what `scope` allows, and its parameters."""
+    if scope is None:
+        return '1 = 1', []
+    clauses, params = [], []
+    for kind, pks in scope.items():
+        code = SOURCES[kind][2]
+        if pks is None:
+            clauses.append(f'{column} %% 8 = {code}')
+        else:
+            sql, pk_params = pks.query.sql_with_params()
+            clauses.append(f'({column} %% 8 = {code} AND {column} / 8 IN ({sql}))')
+            params += pk_params
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+class Fts5Backend:
+    """SQLite FTS5 virtual table ranked with bm25(), rowid is doc_id()."""
+
+    def index(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {TABLE} (rowid, body) VALUES (%s, %s)',
+                [(doc_id(kind, pk), text) for kind, pk, text in documents],
+            )
+
+    def remove(self, keys):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(doc_id(kind, pk),) for kind, pk in keys])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+
+    def search(self, tokens, limit, scope=None):
+        # Every token has to match, each one as a prefix so results show up while typing
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        where, params = scope_sql(scope, 'rowid')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, rank FROM {TABLE} WHERE {TABLE} MATCH %s AND {where} ORDER BY rank LIMIT %s',
+                [match, *params, limit],
+            )
+            # bm25() is lower for better matches
+            return [(*parse_doc_id(rowid), -rank) for rowid, rank in cursor.fetchall()]
+
+
+class PostgresBackend:
+    """tsvector column with a GIN index, ranked with ts_rank()."""
+
+    def index(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (doc_id, document) VALUES (%s, to_tsvector(%s, %s)) '
+                f'ON CONFLICT (doc_id) DO UPDATE SET document = EXCLUDED.document',
+                [(doc_id(kind, pk), TS_CONFIG, text) for kind, pk, text in documents],
+            )
+
+    def remove(self, keys):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE doc_id = ANY(%s)', [[doc_id(kind, pk) for kind, pk in keys]])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {TABLE}')
+
+    def search(self, tokens, limit, scope=None):
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        where, params = scope_sql(scope, 'doc_id')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT doc_id, ts_rank(document, query) AS score '
+                f'FROM {TABLE}, to_tsquery(%s, %s) query WHERE document @@ query AND {where} '
+                f'ORDER BY score DESC, doc_id LIMIT %s',
+                [TS_CONFIG, query, *params, limit],
+            )
+            return [(*parse_doc_id(value), score) for value, score in cursor.fetchall()]
+
+
+class InvertedIndexBackend:
+    """
+    Pure Python inverted index ranked with BM25, for databases without full-text search.
+
+    Postings map each term to {(kind, pk): term frequency} and a sorted vocabulary
+    answers prefix lookups with bisect. The index lives in process memory: it is
+    loaded from the database on first use and kept current by the same signals
+    as the other backends, so each worker process holds its own copy.
+    """
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)
+        self.terms = {}  # (kind, pk) -> {term: frequency}, to take a document back out
+        self.lengths = {}  # (kind, pk) -> number of tokens
+        self.vocabulary = []
+        self.total_length = 0
+
+    def _load(self):
+        if not self.loaded:
+            self.loaded = True
+            for batch in all_documents():
+                self._add(batch)
+
+    def _add(self, documents):
+        for kind, pk, text in documents:
+            key = (kind, pk)
+            self._discard(key)
+            frequencies = defaultdict(int)
+            for token in tokenize(text):
+                frequencies[token] += 1
+            for term, frequency in frequencies.items():
+                if term not in self.postings:
+                    bisect.insort(self.vocabulary, term)
+                self.postings[term][key] = frequency
+            self.terms[key] = frequencies
+            self.lengths[key] = sum(frequencies.values())
+            self.total_length += self.lengths[key]
+
+    def _discard(self, key):
+        frequencies = self.terms.pop(key, None)
+        if frequencies is None:
+            return
+        self.total_length -= self.lengths.pop(key)
+        for term in frequencies:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def index(self, documents):
+        with self.lock:
+            self._load()
+            self._add(documents)
+
+    def remove(self, keys):
+        with self.lock:
+            self._load()
+            for key in keys:
+                self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self._reset()
+            self.loaded = True
+
+    def expand(self, token):
+        # Vocabulary terms starting with the token
+        start = bisect.bisect_left(self.vocabulary, token)
+        end = bisect.bisect_left(self.vocabulary, token + '\uffff')
+        return self.vocabulary[start:end]
+
+    def search(self, tokens, limit, scope=None):
+        # Sets of allowed pks per kind, read before taking the lock
+        allowed = None
+        if scope is not None:
+            allowed = {kind: None if pks is None else set(pks.values_list('pk', flat=True)) for kind, pks in scope.items()}
+        with self.lock:
+            self._load()
+            if not self.terms:
+                return []
+            total = len(self.terms)
+            average_length = self.total_length / total or 1
+            scores = None
+            for token in tokens:
+                token_scores = defaultdict(float)
+                for term in self.expand(token):
+                    postings = self.postings[term]
+                    idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, frequency in postings.items():
+                        if allowed is not None and allowed[key[0]] is not None and key[1] not in allowed[key[0]]:
+                            continue
+                        norm = frequency + self.k1 * (1 - self.b + self.b * self.lengths[key] / average_length)
+                        token_scores[key] += idf * frequency * (self.k1 + 1) / norm
+                if scores is None:
+                    scores = token_scores
+                else:
+                    # Every token has to match
+                    scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+                if not scores:
+                    return []
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [(kind, pk, score) for (kind, pk), score in ranked]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """SEARCH_BACKEND if set, else FTS5 or tsvector when the database has the table, else the in-memory index."""
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    if connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names():
+        return Fts5Backend()
+    return InvertedIndexBackend()
+
+
+def document_text(instance):
+    _, fields, _ = SOURCES[KINDS[type(instance)]]
+    return ' '.join(getattr(instance, field) or '' for field in fields)
+
+
+def documents(kind, batch_size=None):
+    """Every (kind, pk, text) of one source, in batches of batch_size."""
+    model, fields, _ = SOURCES[kind]
+    rows = model.objects.order_by('pk').values_list('pk', *fields).iterator(chunk_size=batch_size or BATCH_SIZE)
+    while True:
+        batch = list(islice(rows, batch_size or BATCH_SIZE))
+        if not batch:
+            return
+        yield [(kind, pk, ' '.join(value or '' for value in values)) for pk, *values in batch]
+
+
+def all_documents(batch_size=None):
+    for kind in SOURCES:
+        yield from documents(kind, batch_size)
+
+
+def index_instances(instances):
+    get_search_backend().index([(KINDS[type(instance)], instance.pk, document_text(instance)) for instance in instances])
+
+
+def remove_documents(kind, pks):
+    get_search_backend().remove([(kind, pk) for pk in pks])
+
+
+def index_on_commit(instances):
+    """Index saved instances once the transaction commits, so a rollback doesn't leave them searchable."""
+    instances = list(instances)
+    if instances:
+        transaction.on_commit(lambda: index_instances(instances))
+
+
+def remove_on_commit(kind, pks):
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: remove_documents(kind, pks))
+
+
+def rebuild_index(backend=None, batch_size=None):
+    """Reindex every source from scratch. Returns {kind: documents indexed}."""
+    backend = backend or get_search_backend()
+    counts = {}
+    with transaction.atomic():
+        backend.clear()
+        for kind in SOURCES:
+            counts[kind] = 0
+            for batch in documents(kind, batch_size):
+                backend.index(batch)
+                counts[kind] += len(batch)
+    return counts
+
+
+def visible(user, kind, pks):
+    """{pk: object} of the hits `user` may see: their tasks, comments on them, the group chat and their conversations."""
+    if kind == 'task':
+        objects = Task.objects.visible_to(user, pk__in=pks)
+    elif kind == 'comment':
+        objects = Comment.objects.filter(pk__in=pks, post__in=Task.objects.visible_to(user)).select_related('post')
+    elif kind == 'message':
+        objects = Message.objects.filter(pk__in=pks).select_related('sender')
+    else:
+        objects = PrivateMessage.objects.filter(pk__in=pks, conversation__participants=user).select_related('sender')
+    return {obj.pk: obj for obj in objects}
+
+
+def search(user, query, backend=None, limit=None):
+    """
+    Ranked SearchResults for `query` among what `user` can see, best first.
+
+    The backend ranks only the documents in visible_scope(user) and returns up to
+    `limit` hits, then one query per kind loads them. Hits that point at deleted
+    rows are dropped there.
+    """
+    tokens = tokenize(query or '')
+    if not tokens:
+        return []
+    hits = (backend or get_search_backend()).search(tokens, limit or MAX_HITS, visible_scope(user))
+
+    pks_by_kind = defaultdict(list)
+    for kind, pk, _ in hits:
+        pks_by_kind[kind].append(pk)
+    objects = {kind: visible(user, kind, pks) for kind, pks in pks_by_kind.items()}
+    return [
+        SearchResult(kind, objects[kind][pk], score)
+        for kind, pk, score in hits
+        if pk in objects[kind]
+    ]
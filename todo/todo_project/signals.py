@@ -1,10 +1,25 @@
 # signals.py
 from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models import F
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Task, Category, ActivityLog, Notification, User
+from .models import Task, Category, UserCategory, Comment, Message, PrivateMessage, Notification, Profile, User
+from .dashboard import invalidate_dashboard_stats
+from .activity import log_activity
+from .bulk import in_bulk_operation
+from .scheduler import notify_scheduler
+from .realtime import TASK_FIELDS, created_task_diff, push_notifications, push_task_diffs, push_unread_delta, task_diff
+from .recurrence import reindex_template
+from .search import KINDS, index_on_commit, remove_on_commit
+from .typeahead import invalidate_typeahead, invalidate_all_typeahead
 from django.urls import reverse
 
+def describe_changes(task):
+    # Human readable list of what this save changed, from the tracked fields (no extra query)
+    fields = {field.attname: field for field in task._meta.concrete_fields}
+    return ', '.join(str(fields[name].verbose_name) for name in task.changed_fields())
+
 @receiver(post_save, sender=Task)
 def log_task_activity(sender, instance, created, **kwargs):
     if created:
@@ -17,8 +32,11 @@ def log_task_activity(sender, instance, created, **kwargs):
         else:
             action = 'task_update'
             details = f"Task '{instance.title}' was updated by {instance.assigned_to.username if instance.assigned_to else instance.user.username}."
+        changed = describe_changes(instance)
+        if changed:
+            details += f" Changed: {changed}."
 
-    ActivityLog.objects.create(
+    log_activity(
         user=instance.assigned_to if instance.assigned_to else instance.user,  # Who did the action
         action=action,
         object_id=instance.id,
@@ -27,17 +45,79 @@ def log_task_activity(sender, instance, created, **kwargs):
 
 @receiver(post_delete, sender=Task)
 def log_task_delete(sender, instance, **kwargs):
-    ActivityLog.objects.create(
-        user=instance.user,
+    if in_bulk_operation():
+        return  # bulk.py writes these logs itself, one bulk_create per chunk
+    log_activity(
+        user_id=instance.user_id,
         action='task_delete',
         object_id=instance.id,
         details=f"Task '{instance.title}' was deleted by {instance.assigned_to.username if instance.assigned_to else instance.user.username}."
     )
 
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_counts(sender, instance, **kwargs):
+    if in_bulk_operation():
+        return  # invalidated once per chunk instead
+    # Dashboard counters for the owner, the assignee and any previous assignee are stale now
+    previous_assignee_id, _ = instance.changed_fields().get('assigned_to_id', (None, None))
+    invalidate_dashboard_stats(instance.user_id, instance.assigned_to_id, previous_assignee_id)
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def reschedule_recurring_task(sender, instance, created=False, **kwargs):
+    # Refresh the occurrence index and let a running recurrence scheduler update its heap
+    if instance.parent_task_id is None and (instance.recurring or 'recurring' in instance.changed_fields()):
+        task_id = instance.pk  # deletes reset instance.pk before on_commit runs
+        if kwargs['signal'] is post_save:
+            transaction.on_commit(lambda: reindex_template(task_id))
+        transaction.on_commit(lambda: notify_scheduler(task_id))
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=PrivateMessage)
+def update_search_index(sender, instance, created, **kwargs):
+    # Task saves are mostly checkbox toggles, only reindex when the text changed
+    if sender is Task and not created and not {'title', 'description'} & instance.changed_fields().keys():
+        return
+    index_on_commit([instance])
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=PrivateMessage)
+def remove_from_search_index(sender, instance, **kwargs):
+    if in_bulk_operation():
+        return  # bulk.py removes a whole chunk at once
+    remove_on_commit(KINDS[sender], [instance.pk])
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def refresh_typeahead_for_task(sender, instance, created=False, **kwargs):
+    if in_bulk_operation():
+        return  # only completed tasks are bulk deleted, they aren't suggested
+    changed = instance.changed_fields()
+    if created or kwargs['signal'] is post_delete or {'title', 'completed', 'user_id', 'assigned_to_id'} & changed.keys():
+        previous_assignee_id, _ = changed.get('assigned_to_id', (None, None))
+        previous_owner_id, _ = changed.get('user_id', (None, None))
+        invalidate_typeahead(instance.user_id, instance.assigned_to_id, previous_assignee_id, previous_owner_id)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_typeahead_for_category(sender, instance, **kwargs):
+    # Categories change rarely and global ones are suggested to everybody
+    invalidate_all_typeahead()
+
+@receiver(post_save, sender=UserCategory)
+@receiver(post_delete, sender=UserCategory)
+def refresh_typeahead_for_sidebar(sender, instance, **kwargs):
+    invalidate_typeahead(instance.user_id)
+
 @receiver(post_save, sender=Category)
 def log_category_activity(sender, instance, created, **kwargs):
     action = 'category_add' if created else 'category_update'
-    ActivityLog.objects.create(
+    log_activity(
         user=instance.user,
         action=action,
         object_id=instance.id,
@@ -46,7 +126,7 @@ def log_category_activity(sender, instance, created, **kwargs):
 
 @receiver(post_delete, sender=Category)
 def log_category_delete(sender, instance, **kwargs):
-    ActivityLog.objects.create(
+    log_activity(
         user=instance.user,
         action='category_delete',
         object_id=instance.id,
@@ -63,15 +143,51 @@ def log_task_assignment(sender, instance, created, **kwargs):
             Notification.objects.create(user=instance.assigned_to, message=message, task=instance)
 
     else:
-        # If the task already exists, check if assigned_to has changed
-        previous = Task.objects.get(pk=instance.pk)
-        if previous.assigned_to != instance.assigned_to:
-            if previous.assigned_to:
+        # If the task already exists, check if assigned_to has changed since it was loaded
+        changed = instance.changed_fields()
+        if 'assigned_to_id' in changed:
+            previous_assignee_id, _ = changed['assigned_to_id']
+            if previous_assignee_id:
                 # Notify the previous assignee that they are no longer assigned
                 message = f"You have been unassigned from: '{instance.title}'"
-                Notification.objects.create(user=previous.assigned_to, message=message, task=instance)
+                Notification.objects.create(user_id=previous_assignee_id, message=message, task=instance)
                 
             if instance.assigned_to:
                 # Notify the new assignee that they have been assigned the task
                 message = f"You have been assigned to: '{instance.title}'"
-                Notification.objects.create(user=instance.assigned_to, message=message, task=instance)
\ No newline at end of file
+                Notification.objects.create(user=instance.assigned_to, message=message, task=instance)
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, created, **kwargs):
+    # Keep Profile.unread_notifications in step so the navbar badge needs no COUNT
+    if created and not instance.is_read:
+        Profile.objects.filter(user_id=instance.user_id).update(
+            unread_notifications=F('unread_notifications') + 1)
+    if created:
+        push_notifications([instance])
+
+@receiver(post_delete, sender=Notification)
+def uncount_unread_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        Profile.objects.filter(user_id=instance.user_id, unread_notifications__gt=0).update(
+            unread_notifications=F('unread_notifications') - 1)
+        push_unread_delta(instance.user_id, -1)
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def push_task_change(sender, instance, created=False, **kwargs):
+    # Live list updates for the owner and the assignee, plus whoever the task was taken from
+    if in_bulk_operation():
+        return  # bulk.py pushes the whole chunk
+    if kwargs['signal'] is post_delete:
+        push_task_diffs([((instance.user_id, instance.assigned_to_id), task_diff(instance.pk, deleted=True))])
+    elif created:
+        push_task_diffs([((instance.user_id, instance.assigned_to_id), created_task_diff(instance))])
+    else:
+        changed = instance.changed_fields()
+        # Only what list rows show, other values (attachments, long descriptions) aren't plain data
+        fields = {name: new for name, (old, new) in changed.items() if name in TASK_FIELDS}
+        if fields:
+            previous_assignee_id, _ = changed.get('assigned_to_id', (None, None))
+            push_task_diffs([((instance.user_id, instance.assigned_to_id, previous_assignee_id), task_diff(instance.pk, fields))])
@@ -1,3 +1,877 @@
-from django.test import TestCase
+import asyncio
+import json
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Q
+from django.db import connection
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .activity import buffer_activity, buffered_activity, flush
+from .bulk import clear_completed_tasks, set_completed
+from .dashboard import get_dashboard_stats, user_stats_key, PRIORITIES
+from .realtime import task_group
+from .recurrence import add_months, next_occurrence, materialize_recurring_tasks, HORIZON_DAYS
+from .scheduler import GROUP, RESCAN_INTERVAL, RecurrenceScheduler, notify_scheduler
+from . import typeahead
+from .search import InvertedIndexBackend, get_search_backend, search
+from channels.layers import get_channel_layer
+from .views import AllTaskListView, RecurringListView, SearchTaskView, group_by_category
+from .models import Task, TaskOccurrence, Category, Profile, Notification, ActivityLog, Comment, Conversation, Message, PrivateMessage
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.other = User.objects.create_user('bob', password='pw')
+        Profile.objects.create(user=cls.user)
+        today = timezone.now().date()
+        Task.objects.create(user=cls.user, title='a', priority='low', due_date=today + timedelta(days=2))
+        Task.objects.create(user=cls.user, title='b', priority='high', due_date=today - timedelta(days=2))
+        Task.objects.create(user=cls.user, title='c', priority='urgent', recurring=True)
+        Task.objects.create(user=cls.user, title='d', priority='medium', completed=True)
+        Task.objects.create(user=cls.other, title='e', priority='low', assigned_to=cls.user)
+        Task.objects.create(user=cls.other, title='f', priority='high')
+        # Spread some tasks across the chart window
+        for days_ago in (1, 3, 9):
+            task = Task.objects.create(user=cls.user, title=f'old {days_ago}', priority='medium')
+            Task.objects.filter(pk=task.pk).update(created_at=today - timedelta(days=days_ago))
+
+    def setUp(self):
+        cache.clear()
+
+    def naive_counts(self, user):
+        # What TaskCountsMixin used to compute one COUNT(*) at a time
+        today = timezone.now().date()
+        visible = Task.objects.filter(Q(user=user) | Q(assigned_to=user))
+        counts = {
+            'all_tasks_count': visible.filter(completed=False).count(),
+            'recurring_tasks_count': visible.filter(recurring=True, completed=False).count(),
+            'scheduled_tasks_count': visible.filter(due_date__gte=today, completed=False).count(),
+            'overdue_tasks_count': visible.filter(due_date__lt=today, completed=False).count(),
+            'completed_tasks_count': Task.objects.filter(completed=True).count(),
+        }
+        for priority in PRIORITIES:
+            counts[f'{priority}_tasks_count'] = visible.filter(priority=priority, completed=False).count()
+            counts[f'{priority}_priority'] = [
+                visible.filter(priority=priority, created_at=today - timedelta(days=7 - i)).count()
+                for i in range(8)
+            ]
+        return counts
+
+    def test_matches_per_series_counts(self):
+        stats = get_dashboard_stats(self.user)
+        for key, value in self.naive_counts(self.user).items():
+            self.assertEqual(stats[key], value, key)
+        self.assertEqual(len(stats['dates']), 8)
+
+    def test_query_budget(self):
+        with self.assertNumQueries(3):
+            get_dashboard_stats(self.user)
+        # Hot reads are served from the cache
+        with self.assertNumQueries(0):
+            get_dashboard_stats(self.user)
+
+    def test_task_changes_invalidate_owner_and_assignee(self):
+        get_dashboard_stats(self.user)
+        get_dashboard_stats(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(user=self.other, title='g', priority='urgent', assigned_to=self.user)
+        self.assertEqual(get_dashboard_stats(self.user)['urgent_tasks_count'], 2)
+        self.assertEqual(get_dashboard_stats(self.other)['all_tasks_count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task.completed = True
+            task.save()
+            # Still cached until the commit, so nobody caches the counts from before it again
+            self.assertIsNotNone(cache.get(user_stats_key(self.user.pk, timezone.now().date())))
+        self.assertEqual(get_dashboard_stats(self.user)['urgent_tasks_count'], 1)
+        self.assertEqual(get_dashboard_stats(self.other)['completed_tasks_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        self.assertEqual(get_dashboard_stats(self.user)['completed_tasks_count'], 1)
+
+    def test_home_page_query_budget(self):
+        self.client.force_login(self.user)
+        # Was ~41 before the dashboard aggregation; what is left is session/auth,
+        # the 3 dashboard queries, recent activity and one query per piece of
+        # global context (profile, sidebar, notifications).
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('task_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['all_tasks_count'], 7)
+
+
+class GlobalContextTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        Profile.objects.create(user=cls.user)
+        for i in range(7):
+            Notification.objects.create(user=cls.user, message=f'unread {i}')
+        for i in range(2):
+            Notification.objects.create(user=cls.user, message=f'read {i}', is_read=True)
+
+    def test_notifications_fetched_once(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('notifications'))
+        with self.assertNumQueries(0):
+            unread = list(response.context['notifications_unread'])
+            read = list(response.context['notifications_read'])
+            unread_count = response.context['unread_count']
+        self.assertEqual(len(unread), 5)
+        self.assertTrue(all(not notification.is_read for notification in unread))
+        self.assertEqual(len(read), 2)
+        self.assertEqual(unread_count, 7)
+        self.assertContains(response, '5+')
+
+
+class UnreadNotificationCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('alice', password='pw')
+        cls.assignee = User.objects.create_user('bob', password='pw')
+        Profile.objects.create(user=cls.owner)
+        Profile.objects.create(user=cls.assignee)
+
+    def unread(self, user):
+        return Profile.objects.get(user=user).unread_notifications
+
+    def test_assignment_increments_and_mark_read_clears(self):
+        Task.objects.create(user=self.owner, title='a', assigned_to=self.assignee)
+        Task.objects.create(user=self.owner, title='b', assigned_to=self.assignee)
+        self.assertEqual(self.unread(self.assignee), 2)
+
+        self.client.force_login(self.assignee)
+        self.client.get(reverse('mark_notifications_as_read'))
+        self.assertEqual(self.unread(self.assignee), 0)
+
+    def test_profile_created_later_starts_with_existing_notifications(self):
+        newcomer = User.objects.create_user('carol', password='pw')
+        Task.objects.create(user=self.owner, title='a', assigned_to=newcomer)
+        self.client.force_login(newcomer)
+        response = self.client.get(reverse('notifications'))
+        self.assertEqual(response.context['unread_count'], 1)
+        self.assertContains(response, 'data-count="1"')
+        self.assertEqual(self.unread(newcomer), 1)
+
+    def test_reconcile_command_fixes_drift(self):
+        Task.objects.create(user=self.owner, title='a', assigned_to=self.assignee)
+        Profile.objects.filter(user=self.assignee).update(unread_notifications=9)
+        Profile.objects.filter(user=self.owner).update(unread_notifications=3)
+        call_command('reconcile_notification_counts', stdout=StringIO())
+        self.assertEqual(self.unread(self.assignee), 1)
+        self.assertEqual(self.unread(self.owner), 0)
+
+
+class TaskChangeTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('alice', password='pw')
+        cls.first = User.objects.create_user('bob', password='pw')
+        cls.second = User.objects.create_user('carol', password='pw')
+        cls.task_id = Task.objects.create(user=cls.owner, title='a', assigned_to=cls.first).pk
+
+    def test_changed_fields(self):
+        task = Task.objects.get(pk=self.task_id)
+        self.assertEqual(task.changed_fields(), {})
+        task.priority = 'high'
+        self.assertEqual(task.changed_fields(), {'priority': (None, 'high')})
+        task.save()
+        self.assertEqual(task.changed_fields(), {})
+
+    def test_reassignment_notifies_both_without_reloading_task(self):
+        task = Task.objects.get(pk=self.task_id)
+        task.assigned_to = self.second
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT') and 'FROM "todo_project_task"' in query['sql']
+            for query in queries.captured_queries
+        ))
+        messages = set(Notification.objects.filter(task=task).values_list('user__username', 'message'))
+        self.assertIn(('bob', "You have been unassigned from: 'a'"), messages)
+        self.assertIn(('carol', "You have been assigned to: 'a'"), messages)
+        log = ActivityLog.objects.filter(object_id=task.pk, action='task_update').get()
+        self.assertIn('Changed: assigned to', log.details)
+
+
+    def test_refresh_from_db_takes_a_new_snapshot(self):
+        task = Task.objects.get(pk=self.task_id)
+        other = Task.objects.get(pk=self.task_id)
+        other.title = 'changed elsewhere'
+        other.save()
+        task.refresh_from_db()
+        self.assertEqual(task.title, 'changed elsewhere')
+        self.assertEqual(task.changed_fields(), {})
+
+        other.priority = 'urgent'
+        other.save()
+        task.title = 'local edit'
+        task.refresh_from_db(fields=['priority'])
+        self.assertEqual(task.changed_fields(), {'title': ('changed elsewhere', 'local edit')})
+
+
+class BufferedActivityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        for i in range(5):
+            Task.objects.create(user=cls.user, title=f'task {i}', completed=True)
+
+    def activity_inserts(self, queries):
+        return [q for q in queries if q['sql'].startswith('INSERT INTO "todo_project_activitylog"')]
+
+    def test_entries_written_in_one_batch_on_commit(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with buffered_activity():
+                Task.objects.filter(completed=True).delete()
+                self.assertFalse(ActivityLog.objects.filter(action='task_delete').exists())
+        self.assertEqual(len(self.activity_inserts(queries.captured_queries)), 1)
+        self.assertEqual(ActivityLog.objects.filter(action='task_delete').count(), 5)
+
+    def test_entries_dropped_when_block_fails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), buffered_activity():
+                Task.objects.create(user=self.user, title='doomed')
+                raise ValueError
+        self.assertFalse(ActivityLog.objects.filter(details__contains='doomed').exists())
+
+    def test_views_log_through_one_batch(self):
+        @buffer_activity
+        def view(request, fail=False):
+            for i in range(3):
+                Task.objects.create(user=self.user, title=f'view task {i}')
+            if fail:
+                raise ValueError
+            return 'done'
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(view(None), 'done')
+        self.assertEqual(len(self.activity_inserts(queries.captured_queries)), 1)
+        self.assertEqual(ActivityLog.objects.filter(details__contains='view task').count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ValueError):
+            view(None, fail=True)
+        self.assertEqual(Task.objects.filter(title__startswith='view task').count(), 3)
+        self.assertEqual(ActivityLog.objects.filter(details__contains='view task').count(), 3)
+
+    def test_task_views_are_buffered(self):
+        task = Task.objects.create(user=self.user, title='toggled')
+        self.client.force_login(self.user)
+        with patch('todo_project.activity.flush', wraps=flush) as flushed, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_completed'), json.dumps({'task_id': task.pk, 'completed': True}), content_type='application/json')
+            self.client.post(reverse('delete_task', args=[task.pk]))
+        self.assertEqual(flushed.call_count, 2)
+        self.assertEqual(ActivityLog.objects.filter(object_id=task.pk, action__in=['task_complete', 'task_delete']).count(), 2)
+
+    @override_settings(ACTIVITY_LOG_BUFFERED=False)
+    def test_synchronous_fallback(self):
+        with CaptureQueriesContext(connection) as queries, buffered_activity():
+            Task.objects.filter(completed=True).delete()
+        self.assertEqual(len(self.activity_inserts(queries.captured_queries)), 5)
+
+
+class ClearCompletedTasksTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        for i in range(5):
+            task = Task.objects.create(user=cls.user, title=f'done {i}', completed=True)
+            Comment.objects.create(post=task, user=cls.user, name='alice', body='nice')
+        Task.objects.create(user=cls.user, title='open')
+
+    def test_deletes_in_chunks_with_one_log_insert_per_chunk(self):
+        with CaptureQueriesContext(connection) as queries:
+            deleted = clear_completed_tasks(chunk_size=2)
+        self.assertEqual(deleted, 5)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "todo_project_activitylog"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(ActivityLog.objects.filter(action='task_delete').count(), 5)
+        self.assertEqual(list(Task.objects.values_list('title', flat=True)), ['open'])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('clear_completed'))
+        self.assertRedirects(response, reverse('completed_list'))
+        self.assertFalse(Task.objects.filter(completed=True).exists())
+
+
+class RecurrenceEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.assignee = User.objects.create_user('bob', password='pw')
+        Profile.objects.create(user=cls.assignee)
+
+    def template(self, interval, due_date, **kwargs):
+        return Task.objects.create(user=self.user, title=interval, recurring=True,
+                                   recurring_interval=interval, due_date=due_date, **kwargs)
+
+    def test_calendar_math(self):
+        self.assertEqual(add_months(date(2024, 1, 31), 1), date(2024, 2, 29))
+        self.assertEqual(add_months(date(2023, 12, 15), 2), date(2024, 2, 15))
+        monthly = Task(due_date=date(2024, 1, 31), recurring_interval='monthly')
+        self.assertEqual(next_occurrence(monthly, date(2024, 3, 1)), date(2024, 3, 31))
+        weekly = Task(due_date=date(2024, 1, 1), recurring_interval='weekly')
+        self.assertEqual(next_occurrence(weekly, date(2024, 1, 9)), date(2024, 1, 15))
+        ended = Task(due_date=date(2024, 1, 1), recurring_interval='daily', recurring_end_date=date(2024, 1, 5))
+        self.assertIsNone(next_occurrence(ended, date(2024, 1, 6)))
+
+    def test_materializes_once_and_is_idempotent(self):
+        today = date(2024, 5, 10)
+        daily = self.template('daily', date(2024, 5, 1), assigned_to=self.assignee)
+        monthly = self.template('monthly', date(2024, 1, 31), recurring_end_date=date(2024, 12, 31))
+        self.template('weekly', date(2024, 1, 1), recurring_end_date=date(2024, 2, 1))  # already over
+
+        self.assertEqual(materialize_recurring_tasks(today=today, chunk_size=2), 2)
+        self.assertEqual(materialize_recurring_tasks(today=today, chunk_size=2), 0)
+        self.assertEqual(list(daily.clones.values_list('due_date', flat=True)), [today])
+        self.assertEqual(list(monthly.clones.values_list('due_date', flat=True)), [date(2024, 5, 31)])
+        self.assertEqual(ActivityLog.objects.filter(action='task_add', details__contains='recurrence').count(), 2)
+        self.assertEqual(Profile.objects.get(user=self.assignee).unread_notifications, 2)
+
+    def test_query_count_does_not_grow_with_templates(self):
+        for i in range(20):
+            self.template('weekly', date(2024, 5, 3))
+        # index prune, template read, existing clones, task insert, activity insert,
+        # index delete + insert (+ the chunk's savepoint pair)
+        with self.assertNumQueries(9):
+            materialize_recurring_tasks(today=date(2024, 5, 10))
+
+
+class RecurrenceSchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def test_wakes_per_occurrence_and_follows_changes(self):
+        today = date(2024, 5, 10)
+        daily = Task.objects.create(user=self.user, title='daily', recurring=True,
+                                    recurring_interval='daily', due_date=date(2024, 5, 1))
+        scheduler = RecurrenceScheduler()
+        scheduler.load(today)
+        self.assertEqual(scheduler.next_due(), today)
+
+        self.assertEqual(len(scheduler.run_due(today)), 1)
+        self.assertEqual(scheduler.next_due(), today + timedelta(days=1))
+        self.assertEqual(scheduler.run_due(today), [])
+
+        scheduler.run_due(today + timedelta(days=1))
+        self.assertEqual(sorted(daily.clones.values_list('due_date', flat=True)),
+                         [today, today + timedelta(days=1)])
+
+        Task.objects.filter(pk=daily.pk).update(recurring=False)
+        scheduler.refresh(daily.pk, today)
+        self.assertIsNone(scheduler.next_due())
+
+    def test_rescan_only_wakes_templates_with_work(self):
+        today = date(2024, 5, 10)
+        weekly = Task.objects.create(user=self.user, title='weekly', recurring=True,
+                                     recurring_interval='weekly', due_date=date(2024, 5, 3))
+        scheduler = RecurrenceScheduler()
+        scheduler.load(today)
+        scheduler.run_due(today)
+        self.assertEqual(scheduler.next_due(), date(2024, 5, 11))
+
+        # Templates and their clones, no materializing
+        with self.assertNumQueries(2):
+            scheduler.load(today)
+        self.assertEqual(scheduler.next_due(), date(2024, 5, 11))
+        with self.assertNumQueries(0):
+            self.assertEqual(scheduler.run_due(today), [])
+
+        # A template whose upcoming occurrence is missing is due straight away
+        weekly.clones.all().delete()
+        scheduler.load(today)
+        self.assertEqual(scheduler.next_due(), today)
+
+    def test_change_notifications_are_best_effort(self):
+        class DownLayer:
+            async def group_send(self, group, message):
+                raise ConnectionError('layer is down')
+
+        with patch('todo_project.realtime.get_channel_layer', return_value=DownLayer()), \
+                self.assertLogs('todo_project.realtime', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(user=self.user, title='daily', recurring=True,
+                                       recurring_interval='daily', due_date=date(2024, 5, 1))
+        self.assertTrue(Task.objects.filter(pk=task.pk).exists())
+
+        async def notify():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add(GROUP, channel)
+            await sync_to_async(notify_scheduler)(task.pk)
+            return await asyncio.wait_for(layer.receive(channel), 1)
+        self.assertEqual(async_to_sync(notify)(), {'type': 'task.changed', 'task_id': task.pk})
+
+
+    @override_settings(TIME_ZONE='Europe/Berlin')
+    def test_days_follow_the_local_date(self):
+        Task.objects.create(user=self.user, title='daily', recurring=True,
+                            recurring_interval='daily', due_date=date(2024, 5, 1))
+        # 01:30 on May 11 in Berlin, still May 10 in UTC
+        utc_now = datetime(2024, 5, 10, 23, 30, tzinfo=dt_timezone.utc)
+        with patch('django.utils.timezone.now', return_value=utc_now):
+            scheduler = RecurrenceScheduler()
+            scheduler.load()
+            self.assertEqual(scheduler.next_due(), date(2024, 5, 11))
+            self.assertEqual(scheduler.seconds_until_next(), 0)
+            # Due now means something to do, not a busy loop
+            self.assertEqual(len(scheduler.run_due()), 1)
+            self.assertEqual(scheduler.next_due(), date(2024, 5, 12))
+            self.assertEqual(scheduler.seconds_until_next(), min(22.5 * 60 * 60, RESCAN_INTERVAL))
+
+
+class OccurrenceIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def test_engine_indexes_rolling_horizon(self):
+        today = date(2024, 5, 10)
+        weekly = Task.objects.create(user=self.user, title='weekly', recurring=True,
+                                     recurring_interval='weekly', due_date=date(2024, 5, 6))
+        materialize_recurring_tasks(today=today)
+        dates = list(weekly.occurrences.values_list('date', flat=True).order_by('date'))
+        self.assertEqual(dates[0], date(2024, 5, 13))
+        self.assertEqual(len(dates), HORIZON_DAYS // 7 + (1 if (HORIZON_DAYS % 7) >= 3 else 0))
+        self.assertTrue(all((d - dates[0]).days % 7 == 0 for d in dates))
+
+        Task.objects.filter(pk=weekly.pk).update(recurring=False)
+        materialize_recurring_tasks(today=today)
+        self.assertFalse(TaskOccurrence.objects.exists())
+
+    def test_saving_template_reindexes_and_views_list_occurrences(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(user=self.user, title='daily', recurring=True,
+                                       recurring_interval='daily', due_date=timezone.now().date())
+        self.assertEqual(task.occurrences.count(), HORIZON_DAYS)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('recurring_list'))
+        self.assertEqual(len(response.context['upcoming_occurrences']), RecurringListView.upcoming_limit)
+        # The soonest ones
+        self.assertEqual([o.date for o in response.context['upcoming_occurrences']],
+                         list(task.occurrences.order_by('date').values_list('date', flat=True)[:RecurringListView.upcoming_limit]))
+        self.assertContains(response, 'Upcoming')
+
+
+@skipUnless(connection.vendor == 'sqlite', "Plans are asserted in SQLite's EXPLAIN QUERY PLAN format")
+class HotQueryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertIn('USING', plan)
+        # A bare "SCAN <table>" is a full table scan, "SCAN <table> USING INDEX" walks an index
+        for line in plan.splitlines():
+            self.assertFalse('SCAN todo_project_' in line and 'INDEX' not in line, plan)
+        return plan
+
+    def test_hot_queries_use_indexes(self):
+        user, today = self.user, timezone.now().date()
+        visible = Task.objects.filter(Q(user=user) | Q(assigned_to=user))
+        self.assertIn('MULTI-INDEX OR', self.assertUsesIndex(visible.filter(completed=False, due_date__lt=today)))
+        plan = self.assertUsesIndex(Task.objects.visible_to(user, completed=False, due_date__lt=today))
+        self.assertIn('task_user_open_due_idx', plan)
+        self.assertIn('task_assignee_open_due_idx', plan)
+        self.assertIn('task_user_open_due_idx', self.assertUsesIndex(
+            Task.objects.filter(user=user, completed=False, due_date__lt=today)))
+        self.assertIn('task_assignee_open_due_idx', self.assertUsesIndex(
+            Task.objects.filter(assigned_to=user, completed=False, due_date__gte=today)))
+        self.assertIn('task_user_created_idx', self.assertUsesIndex(
+            Task.objects.filter(user=user, created_at__gte=today)))
+        self.assertIn('task_user_recurring_idx', self.assertUsesIndex(
+            Task.objects.filter(user=user, recurring=True, completed=False)))
+        self.assertIn('task_user_bookmarked_idx', self.assertUsesIndex(
+            Task.objects.filter(user=user, bookmarked=True)))
+        self.assertIn('task_completed_idx', self.assertUsesIndex(Task.objects.filter(completed=True)))
+        self.assertIn('notification_unread_idx', self.assertUsesIndex(
+            Notification.objects.filter(user=user, is_read=False).order_by('-timestamp')))
+        self.assertIn('notification_user_ts_idx', self.assertUsesIndex(
+            Notification.objects.filter(user=user).order_by('-timestamp')))
+        self.assertIn('activity_user_ts_idx', self.assertUsesIndex(
+            ActivityLog.objects.filter(user=user, timestamp__gte=timezone.now()).order_by('-timestamp')))
+
+
+class VisibleToTests(TestCase):
+    def test_same_rows_as_owner_or_assignee(self):
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        Task.objects.create(user=alice, title='own')
+        Task.objects.create(user=alice, title='own, self assigned', assigned_to=alice)
+        Task.objects.create(user=bob, title='assigned', assigned_to=alice, completed=True)
+        Task.objects.create(user=bob, title='not visible')
+        for filters in ({}, {'completed': False}, {'completed': True}):
+            expected = Task.objects.filter(Q(user=alice) | Q(assigned_to=alice), **filters)
+            self.assertQuerySetEqual(
+                Task.objects.visible_to(alice, **filters).order_by('pk'), expected.order_by('pk'))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        Profile.objects.create(user=cls.user)
+        today = timezone.now().date()
+        # Shared due dates and a few without one, the cursor has to break ties on id
+        for i in range(7):
+            Task.objects.create(user=cls.user, title=f'task {i}', due_date=today + timedelta(days=i // 3) if i < 5 else None)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def walk(self, name):
+        titles, cursor = [], None
+        while True:
+            params = {'format': 'json', **({'after': cursor} if cursor else {})}
+            page = self.client.get(reverse(name), params).json()
+            titles += [task['title'] for task in page['results']]
+            cursor = page['next']
+            if cursor is None:
+                return titles
+
+    def test_pages_cover_every_task_once_in_order(self):
+        with patch.object(AllTaskListView, 'paginate_by', 2):
+            titles = self.walk('all_list')
+        self.assertEqual(titles, [f'task {i}' for i in range(7)])
+
+    def test_later_pages_cost_the_same_as_the_first(self):
+        with patch.object(AllTaskListView, 'paginate_by', 2):
+            first = self.client.get(reverse('all_list'), {'format': 'json'}).json()
+            with CaptureQueriesContext(connection) as page_one:
+                self.client.get(reverse('all_list'), {'format': 'json'})
+            with CaptureQueriesContext(connection) as page_two:
+                self.client.get(reverse('all_list'), {'format': 'json', 'after': first['next']})
+        self.assertEqual(len(page_one), len(page_two))
+        self.assertNotIn('OFFSET', page_two[-1]['sql'])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('all_list'), {'after': 'nonsense'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TaskGroupingTests(TestCase):
+    def test_groups_keep_task_order_and_collect_uncategorized(self):
+        alice = User.objects.create_user('alice', password='pw')
+        work = Category.objects.create(user=alice, name='work')
+        home = Category.objects.create(user=alice, name='home')
+        for title, category in [('a', home), ('b', None), ('c', work), ('d', home)]:
+            Task.objects.create(user=alice, title=title, category=category)
+        with self.assertNumQueries(1):
+            uncategorized, groups = group_by_category(Task.objects.select_related('category').order_by('title'))
+            self.assertEqual([task.title for task in uncategorized], ['b'])
+            self.assertEqual(
+                [(category.name, [task.title for task in tasks]) for category, tasks in groups.items()],
+                [('work', ['c']), ('home', ['a', 'd'])])
+
+    def test_list_pages_run_one_task_query(self):
+        alice = User.objects.create_user('alice', password='pw')
+        Profile.objects.create(user=alice)
+        work = Category.objects.create(user=alice, name='work')
+        for i in range(5):
+            Task.objects.create(user=alice, title=f'task {i}', category=work if i % 2 else None, recurring=True, bookmarked=True)
+        self.client.force_login(alice)
+        for name in ('all_list', 'recurring_list', 'bookmark_list'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertContains(response, 'work')
+            task_queries = [q['sql'] for q in queries if 'FROM "todo_project_task"' in q['sql'] and 'occurrence' not in q['sql']]
+            self.assertEqual(len(task_queries), 1, name)
+            self.assertNotIn('todo_project_category', ' '.join(q['sql'] for q in queries if 'DISTINCT' in q['sql']))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        Profile.objects.create(user=cls.alice)
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.report = Task.objects.create(user=self.alice, title='Quarterly report', description='budget numbers')
+            self.budget = Task.objects.create(user=self.alice, title='Budget', description='budget budget review')
+            Task.objects.create(user=self.bob, title='Private budget')
+            Comment.objects.create(post=self.report, user=self.bob, name='bob', body='check the budget again')
+            Message.objects.create(sender=self.bob, content='budget meeting at noon', room_name='group_chat_gfg')
+            hidden = Conversation.objects.create()
+            hidden.participants.add(self.bob)
+            PrivateMessage.objects.create(conversation=hidden, sender=self.bob, content='my budget')
+
+    def test_ranked_results_across_sources_limited_to_what_the_user_sees(self):
+        results = search(self.alice, 'budg')
+        self.assertEqual(results[0].object, self.budget)
+        self.assertEqual(sorted(result.kind for result in results), ['comment', 'message', 'task', 'task'])
+        self.assertEqual([result.object for result in search(self.alice, 'budget quarterly')], [self.report])
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.report.title = 'Annual summary'
+            self.report.save()
+        self.assertEqual([result.object for result in search(self.alice, 'annual')], [self.report])
+        self.assertEqual(search(self.alice, 'quarterly'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.filter(pk=self.budget.pk).update(completed=True)
+            clear_completed_tasks()
+        # Gone from the index itself, not just filtered out as a deleted row
+        self.assertEqual(get_search_backend().search(['review'], 10), [])
+
+    def test_inverted_index_matches_the_database_backend(self):
+        backend = InvertedIndexBackend()
+        for query in ('budg', 'budget review', 'report', 'nothing'):
+            self.assertEqual(
+                {(r.kind, r.object.pk) for r in search(self.alice, query, backend)},
+                {(r.kind, r.object.pk) for r in search(self.alice, query)})
+        backend.remove([('task', self.budget.pk)])
+        self.assertEqual(search(self.alice, 'review', backend), [])
+
+    def test_other_users_better_hits_do_not_crowd_out_own_results(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(30):
+                Task.objects.create(user=self.bob, title=f'budget budget budget {i}')
+        for backend in (None, InvertedIndexBackend()):
+            results = search(self.alice, 'budget', backend, limit=3)
+            self.assertEqual(len(results), 3)
+            self.assertEqual(results[0].object, self.budget)
+        self.assertEqual(len(search(self.alice, 'budget', limit=10)), 4)
+
+    def test_view_paginates(self):
+        self.client.force_login(self.alice)
+        with patch.object(SearchTaskView, 'paginate_by', 2):
+            response = self.client.get(reverse('search_task'), {'q': 'budget'})
+        self.assertEqual(len(response.context['results']), 2)
+        self.assertEqual(response.context['paginator'].count, 4)
+        self.assertContains(response, 'Budget')
+
+
+class TypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        Task.objects.create(user=cls.alice, title='Budget review')
+        Task.objects.create(user=cls.bob, title='Buy milk', assigned_to=cls.alice)
+        Task.objects.create(user=cls.bob, title='Bugs for bob only')
+        Category.objects.create(user=cls.alice, name='Business')
+
+    def setUp(self):
+        cache.clear()
+        typeahead.indexes.clear()
+        self.client.force_login(self.alice)
+
+    def test_suggestions_without_queries_after_the_first_keystroke(self):
+        response = self.client.get(reverse('search_suggestions'), {'q': 'bu'})
+        self.assertEqual([r['label'] for r in response.json()['results']], ['Budget review', 'Business', 'Buy milk'])
+        with self.assertNumQueries(0):
+            self.assertEqual([label for _, _, label in typeahead.suggest(self.alice, 'rev')], ['Budget review'])
+        with self.assertNumQueries(0):
+            self.assertEqual([label for _, _, label in typeahead.suggest(self.alice, 'budget re')], ['Budget review'])
+
+    def test_signals_refresh_the_index(self):
+        self.assertEqual(typeahead.suggest(self.alice, 'tax'), [])
+        Task.objects.create(user=self.alice, title='Tax return')
+        self.assertEqual([label for _, _, label in typeahead.suggest(self.alice, 'tax')], ['Tax return'])
+        Task.objects.filter(title='Tax return').get().delete()
+        self.assertEqual(typeahead.suggest(self.alice, 'tax'), [])
+
+    def test_lru_bounds_the_number_of_indexes(self):
+        lru = typeahead.TypeaheadCache(max_users=1)
+        lru.get(self.alice)
+        lru.get(self.bob)
+        self.assertEqual(list(lru.indexes), [self.bob.pk])
+
+
+class MarkCompletedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.tasks = [Task.objects.create(user=cls.alice, title=f'task {i}') for i in range(6)]
+        cls.foreign = Task.objects.create(user=cls.bob, title='not yours')
+
+    def setUp(self):
+        self.client.force_login(self.alice)
+
+    def post(self, name, body):
+        return self.client.post(reverse(name), json.dumps(body), content_type='application/json').json()
+
+    def test_single_task_only_writes_the_flag(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.post('mark_completed', {'task_id': self.tasks[0].pk, 'completed': True})['success'])
+        update = next(q['sql'] for q in queries if q['sql'].startswith('UPDATE "todo_project_task"'))
+        self.assertIn('SET "completed"', update)
+        self.assertNotIn('"title"', update)
+
+    def test_bulk_costs_the_same_for_any_number_of_tasks(self):
+        def complete(tasks):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post('mark_completed_bulk', {'updates': [{'task_id': task.pk, 'completed': True} for task in tasks]})
+            return response, len(queries)
+
+        response, few = complete(self.tasks[:2])
+        self.assertEqual(response['updated'], 2)
+        response, many = complete(self.tasks[2:] + [self.foreign])
+        self.assertEqual(response['updated'], 4)
+        self.assertEqual(few, many)
+        self.assertEqual(Task.objects.filter(completed=True).count(), 6)
+        self.assertFalse(Task.objects.get(pk=self.foreign.pk).completed)
+        self.assertEqual(ActivityLog.objects.filter(action='task_complete').count(), 6)
+
+    def test_bulk_rejects_malformed_bodies(self):
+        self.assertFalse(self.post('mark_completed_bulk', {'updates': [{'task_id': 'x'}]})['success'])
+        response = self.client.post(reverse('mark_completed_bulk'), json.dumps({'updates': [{'task_id': self.tasks[0].pk, 'completed': 'false'}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Task.objects.get(pk=self.tasks[0].pk).completed)
+
+
+class BulkOperationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.carol = User.objects.create_user('carol', password='pw')
+        for user in (cls.alice, cls.bob, cls.carol):
+            Profile.objects.create(user=user)
+        cls.owned = [Task.objects.create(user=cls.alice, title=f'task {i}', assigned_to=cls.bob if i % 2 else None) for i in range(4)]
+        cls.assigned = Task.objects.create(user=cls.carol, title='for alice', assigned_to=cls.alice)
+        cls.foreign = Task.objects.create(user=cls.carol, title='not yours')
+
+    def setUp(self):
+        self.client.force_login(self.alice)
+
+    def run_operation(self, operation, tasks, value):
+        body = {'operation': operation, 'task_ids': [task.pk for task in tasks], 'value': value}
+        return self.client.post(reverse('bulk_task_operation'), json.dumps(body), content_type='application/json')
+
+    def test_reassign_is_set_based_and_notifies_in_bulk(self):
+        tasks = self.owned + [self.assigned, self.foreign]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.run_operation('reassign', tasks, self.carol.pk)
+        self.assertEqual(response.json(), {'success': True, 'updated': 5})
+        task_updates = [q for q in queries if q['sql'].startswith('UPDATE "todo_project_task"')]
+        self.assertEqual(len(task_updates), 1)
+        self.assertEqual(Task.objects.filter(assigned_to=self.carol).count(), 5)
+        self.assertEqual(Task.objects.get(pk=self.foreign.pk).assigned_to_id, None)
+        self.assertEqual(Notification.objects.filter(user=self.carol).count(), 5)
+        self.assertEqual(Notification.objects.filter(user=self.bob, message__startswith='You have been unassigned').count(), 2)
+        self.assertEqual(Notification.objects.filter(user=self.alice, message__startswith='You have been unassigned').count(), 1)
+        self.assertEqual(Profile.objects.get(user=self.carol).unread_notifications, 5)
+        self.assertEqual(ActivityLog.objects.filter(action='task_update', details__endswith='Changed: assigned to.').count(), 5)
+
+    def test_values_are_validated_by_the_model_field(self):
+        self.assertTrue(self.run_operation('reprioritize', self.owned, 'urgent').json()['success'])
+        self.assertEqual(Task.objects.filter(priority='urgent').count(), 4)
+        for operation, value in [('reprioritize', 'whenever'), ('reassign', 999999), ('delete', None)]:
+            response = self.run_operation(operation, self.owned, value)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+        response = self.client.post(reverse('bulk_task_operation'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(self.run_operation('bookmark', self.owned[:2], True).json()['success'])
+        self.assertEqual(Task.objects.filter(bookmarked=True).count(), 2)
+
+
+class TaskEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pw')
+        cls.bob = User.objects.create_user('bob', password='pw')
+        cls.carol = User.objects.create_user('carol', password='pw')
+        for user in (cls.alice, cls.bob, cls.carol):
+            Profile.objects.create(user=user)
+        cls.tasks = [Task.objects.create(user=cls.alice, title=f'task {i}', assigned_to=cls.bob) for i in range(3)]
+
+    def receive_events(self, change):
+        """{username: [events]} sent to each user's task group while `change` commits."""
+        async def listen():
+            layer = get_channel_layer()
+            channels = {}
+            for user in (self.alice, self.bob, self.carol):
+                channels[user.username] = await layer.new_channel()
+                await layer.group_add(task_group(user.pk), channels[user.username])
+
+            def commit():
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+            await sync_to_async(commit)()
+
+            events = {}
+            for username, channel in channels.items():
+                events[username] = []
+                while True:
+                    try:
+                        events[username].append(await asyncio.wait_for(layer.receive(channel), 0.05))
+                    except asyncio.TimeoutError:
+                        break
+            return events
+        return async_to_sync(listen)()
+
+    def test_reassignment_diff_reaches_owner_and_both_assignees(self):
+        task = Task.objects.get(pk=self.tasks[0].pk)
+
+        def reassign():
+            task.assigned_to = self.carol
+            task.save()
+        events = self.receive_events(reassign)
+        expected = {'type': 'tasks.changed', 'tasks': [{'id': task.pk, 'fields': {'assigned_to_id': self.carol.pk}}]}
+        self.assertEqual(events, {'alice': [expected], 'bob': [expected], 'carol': [expected]})
+
+    def test_diffs_only_carry_list_fields(self):
+        task = Task.objects.get(pk=self.tasks[0].pk)
+
+        def attach():
+            task.file = 'static/img/report.pdf'
+            task.save()
+        self.assertEqual(self.receive_events(attach), {'alice': [], 'bob': [], 'carol': []})
+
+        def attach_and_rename():
+            task.file = 'static/img/summary.pdf'
+            task.title = 'renamed'
+            task.save()
+        events = self.receive_events(attach_and_rename)
+        self.assertEqual(events['alice'][0]['tasks'], [{'id': task.pk, 'fields': {'title': 'renamed'}}])
+        json.dumps(events['alice'][0])
+
+    def test_bulk_changes_are_one_event_per_user(self):
+        events = self.receive_events(lambda: set_completed(self.alice, {task.pk: True for task in self.tasks}))
+        self.assertEqual(len(events['alice']), 1)
+        self.assertEqual(events['alice'], events['bob'])
+        diffs = sorted(events['alice'][0]['tasks'], key=lambda diff: diff['id'])
+        self.assertEqual(diffs, [{'id': task.pk, 'fields': {'completed': True}} for task in self.tasks])
+        self.assertEqual(events['carol'], [])
+
+        events = self.receive_events(lambda: clear_completed_tasks(Task.objects.filter(user=self.alice)))
+        self.assertEqual(events['bob'][0]['tasks'], [{'id': task.pk, 'deleted': True} for task in self.tasks])
+
+    def test_layer_errors_do_not_fail_committed_saves(self):
+        class DownLayer:
+            async def group_send(self, group, message):
+                raise ConnectionError('layer is down')
+
+        with patch('todo_project.realtime.get_channel_layer', return_value=DownLayer()), \
+                self.assertLogs('todo_project.realtime', 'ERROR') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(user=self.alice, title='saved anyway', assigned_to=self.carol)
+        self.assertTrue(Task.objects.filter(pk=task.pk).exists())
+        # The assignment notification and the task diff were both dropped, not raised
+        output = '\n'.join(logs.output)
+        self.assertIn('notifications.push', output)
+        self.assertIn('tasks.changed', output)
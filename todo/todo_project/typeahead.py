@@ -0,0 +1,140 @@
+import bisect
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Task, Category
+from .search import tokenize
+
+
+# How many users keep a prefix index in memory, least recently used ones are dropped first
+MAX_USERS = getattr(settings, 'TYPEAHEAD_MAX_USERS', 1000)
+
+# Suggestions returned per keystroke
+LIMIT = getattr(settings, 'TYPEAHEAD_LIMIT', 10)
+
+# Bumped on changes so every process notices its index is stale, see invalidate_typeahead()
+GLOBAL_VERSION_KEY = 'typeahead:version'
+
+
+def user_version_key(user_id):
+    return f'typeahead:version:{user_id}'
+
+
+class PrefixIndex:
+    """
+    Sorted array of (word, entry) pairs over task titles and category names.
+
+    Every word of a label gets its own pair so "review" finds "Budget review", and a
+    prefix lookup is a bisect plus a scan over the matching slice.
+    """
+
+    def __init__(self, entries, version=None):
+        self.entries = entries  # [(kind, pk, label)]
+        self.version = version
+        pairs = sorted(
+            (word, position)
+            for position, (_, _, label) in enumerate(entries)
+            for word in set(tokenize(label))
+        )
+        self.words = [word for word, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def lookup(self, query, limit=LIMIT):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Candidates come from the first token, the others have to prefix some word of the label too
+        first, rest = tokens[0], tokens[1:]
+        start = bisect.bisect_left(self.words, first)
+        end = bisect.bisect_left(self.words, first + '\uffff')
+        matches = []
+        for position in sorted(set(self.positions[start:end])):
+            kind, pk, label = self.entries[position]
+            words = tokenize(label)
+            if all(any(word.startswith(token) for word in words) for token in rest):
+                matches.append((kind, pk, label))
+        # Labels that start with the query first, then alphabetically
+        lowered = query.strip().lower()
+        matches.sort(key=lambda match: (not match[2].lower().startswith(lowered), match[2].lower(), match[1]))
+        return matches[:limit]
+
+
+def build_index(user, version=None):
+    """Two queries: the tasks the user can see and their categories (own, global or added to the sidebar)."""
+    tasks = Task.objects.visible_to(user, completed=False).values_list('pk', 'title')
+    categories = Category.objects.filter(
+        Q(user=user) | Q(is_global=True) | Q(usercategory__user=user)
+    ).distinct().values_list('pk', 'name')
+    entries = [('task', pk, title) for pk, title in tasks] + [('category', pk, name) for pk, name in categories]
+    return PrefixIndex(entries, version)
+
+
+class TypeaheadCache:
+    """LRU of PrefixIndex per user, rebuilt lazily when missing or stale."""
+
+    def __init__(self, max_users=MAX_USERS):
+        self.max_users = max_users
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def current_version(self, user_id):
+        # One cache round trip per keystroke instead of a database query
+        versions = cache.get_many([GLOBAL_VERSION_KEY, user_version_key(user_id)])
+        return versions.get(GLOBAL_VERSION_KEY, 0), versions.get(user_version_key(user_id), 0)
+
+    def get(self, user):
+        version = self.current_version(user.pk)
+        with self.lock:
+            index = self.indexes.get(user.pk)
+            if index is not None and index.version == version:
+                self.indexes.move_to_end(user.pk)
+                return index
+        index = build_index(user, version)
+        with self.lock:
+            self.indexes[user.pk] = index
+            self.indexes.move_to_end(user.pk)
+            while len(self.indexes) > self.max_users:
+                self.indexes.popitem(last=False)
+        return index
+
+    def discard(self, *user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.indexes.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.indexes.clear()
+
+
+indexes = TypeaheadCache()
+
+
+def suggest(user, query, limit=LIMIT):
+    """[(kind, pk, label)] completing `query` for `user`, tasks and categories mixed."""
+    return indexes.get(user).lookup(query, limit)
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_typeahead(*user_ids):
+    """Mark the prefix indexes of these users stale in every process."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    indexes.discard(*user_ids)
+    for user_id in user_ids:
+        bump(user_version_key(user_id))
+
+
+def invalidate_all_typeahead():
+    # A global category changed, it shows up in everybody's suggestions
+    indexes.clear()
+    bump(GLOBAL_VERSION_KEY)
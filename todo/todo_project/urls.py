@@ -1,25 +1,30 @@
 from django.urls import path
-from .views import TaskCreateView, TaskUpdateView, TaskDeleteView,TaskListView,CategoryListView,AddCategoryView,TaskByCategoryView,CategoryDeleteView,AllTaskListView, CompletedTaskListView,ScheduledTaskListView, OverdueTaskListView,SearchTaskView,mark_completed,ClearCompletedTasksView,AddCommentView,EditCommentView,DeleteCommentView,RecurringListView,BookmarkView,RecentActivityView,mark_notifications_as_read,NotificationsView,mark_global,unmark_global
+from .views import TaskCreateView, TaskUpdateView, TaskDeleteView,TaskListView,CategoryListView,AddCategoryView,TaskByCategoryView,CategoryDeleteView,AllTaskListView, CompletedTaskListView,ScheduledTaskListView, OverdueTaskListView,SearchTaskView,search_suggestions,mark_completed,mark_completed_bulk,bulk_task_operation,ClearCompletedTasksView,AddCommentView,EditCommentView,DeleteCommentView,RecurringListView,BookmarkView,RecentActivityView,mark_notifications_as_read,NotificationsView,mark_global,unmark_global
 from django.conf import settings
 from django.conf.urls.static import static
 from . import views
+from .activity import buffer_activity
 
+# Views that save tasks or categories log through buffer_activity, see activity.py
 urlpatterns = [
     
     path('', TaskListView.as_view(), name='task_list'),
-    path('create/', TaskCreateView.as_view(), name='create_task'),
-    path('update/<int:pk>/', TaskUpdateView.as_view(), name='update_task'),
-    path('delete/<int:pk>/', TaskDeleteView.as_view(), name='delete_task'),
+    path('create/', buffer_activity(TaskCreateView.as_view()), name='create_task'),
+    path('update/<int:pk>/', buffer_activity(TaskUpdateView.as_view()), name='update_task'),
+    path('delete/<int:pk>/', buffer_activity(TaskDeleteView.as_view()), name='delete_task'),
     path('category_list/', CategoryListView.as_view(), name='category_list'),
-    path('add_category/', AddCategoryView.as_view(), name='add_category'),
+    path('add_category/', buffer_activity(AddCategoryView.as_view()), name='add_category'),
     path('tasks/<int:category_id>/', TaskByCategoryView.as_view(), name='tasks_by_category'),
-    path('category/delete/<int:pk>/', CategoryDeleteView.as_view(), name='delete_category'),
+    path('category/delete/<int:pk>/', buffer_activity(CategoryDeleteView.as_view()), name='delete_category'),
     path('all_list', AllTaskListView.as_view(), name='all_list'),
     path('completed_list/', CompletedTaskListView.as_view(), name='completed_list'),
     path('scheduled_list/', ScheduledTaskListView.as_view(), name='scheduled_list'),
     path('overdue_list/', OverdueTaskListView.as_view(), name='overdue_list'),
     path('search_task/', SearchTaskView.as_view(), name='search_task'),
-    path('mark_completed/', mark_completed, name='mark_completed'),
+    path('search_task/suggest/', search_suggestions, name='search_suggestions'),
+    path('mark_completed/', buffer_activity(mark_completed), name='mark_completed'),
+    path('mark_completed/bulk/', mark_completed_bulk, name='mark_completed_bulk'),
+    path('tasks/bulk/', bulk_task_operation, name='bulk_task_operation'),
     path('clear_completed/', ClearCompletedTasksView.as_view(), name='clear_completed'),
     path('add_comment/<int:task_id>/comment/', AddCommentView.as_view(), name='add_comment'),
     path('edit_comment/<int:pk>/comment/', EditCommentView.as_view(), name='edit_comment'),
@@ -29,8 +34,8 @@ urlpatterns = [
     path('recent_activity/', RecentActivityView.as_view(), name='recent_activity'),
     path('mark-as-read/', mark_notifications_as_read, name='mark_notifications_as_read'),
     path('notifications/', NotificationsView.as_view(), name='notifications'),
-    path('categories/mark/<int:category_id>/', mark_global, name='mark_global'),
-    path('categories/unmark/<int:category_id>/', unmark_global, name='unmark_global'),
+    path('categories/mark/<int:category_id>/', buffer_activity(mark_global), name='mark_global'),
+    path('categories/unmark/<int:category_id>/', buffer_activity(unmark_global), name='unmark_global'),
     
 
     
@@ -1,105 +1,81 @@
 from django.views.generic.base import ContextMixin
 # class based views imported from django.generic
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, RedirectView
-from .models import Task, Category, Comment, Conversation, ActivityLog, Notification, UserCategory
+from .models import Task, TaskOccurrence, Category, Comment, Conversation, ActivityLog, Notification, UserCategory, Profile
 # only logged in users can access this view
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from .forms import EditForm, CreateForm, CommentForm, AddCategoryForm
+from .dashboard import get_dashboard_stats
+from .bulk import OPERATIONS, apply_operation, clear_completed_tasks, set_completed
+from .recurrence import HORIZON_DAYS
+from .pagination import KeysetPaginationMixin
+from .realtime import push_unread_delta
+from .search import search
+from .typeahead import suggest
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Q
-from datetime import timedelta, datetime
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.db.models.functions import Greatest
+from datetime import timedelta
 
 
 class TaskCountsMixin(ContextMixin):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
+        # Pie chart, cards and line chart series, see dashboard.get_dashboard_stats
+        context.update(get_dashboard_stats(self.request.user))
+        return context
+
+
+class UpcomingOccurrencesMixin(ContextMixin):
+    # Upcoming dates of the user's recurring tasks, one range scan on the (user, date) index
+    upcoming_limit = 20  # the card shows the next few, not the whole HORIZON_DAYS of every template
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
         today = timezone.now().date()
-        start_date = today - timedelta(days=7)
-
-        # Current counts for pie chart
-        context['all_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            completed=False
-        ).count()
-        context['recurring_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            recurring=True,
-            completed=False
-        ).count()
-        context['scheduled_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            due_date__gte=timezone.now(),
-            completed=False
-        ).count()
-        context['overdue_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            due_date__lt=timezone.now(),
-            completed=False
-        ).count()
-        context['completed_tasks_count'] = Task.objects.filter(
-            completed=True
-        ).count()
-        context['low_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            priority='low',
-            completed=False
-        ).count()
-        context['medium_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            priority='medium',
-            completed=False
-        ).count()
-        context['high_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            priority='high',
-            completed=False
-        ).count()
-        context['urgent_tasks_count'] = Task.objects.filter(
-            Q(user=user) | Q(assigned_to=user),
-            priority='urgent',
-            completed=False
-        ).count()
-
-        # Data for the line chart
-        dates = [start_date + timedelta(days=i)
-                 for i in range(8)]  # 8 to include end_date
-        priority_data = {priority: [
-            0] * len(dates) for priority in ['low', 'medium', 'high', 'urgent']}
-
-        # Count tasks per day
-        for priority in priority_data.keys():
-            for i, date in enumerate(dates):
-                start_of_day = datetime.combine(date, datetime.min.time())
-                # End of the day is 24 hours from start_of_day
-                end_of_day = start_of_day + timedelta(days=1)
-                count = Task.objects.filter(
-                    Q(user=user) | Q(assigned_to=user),
-                    priority=priority,
-                    created_at__gte=start_of_day,
-                    created_at__lt=end_of_day  # Use < for exclusive end
-                ).count()
-                priority_data[priority][i] = count
-
-        context['low_priority'] = priority_data['low']
-        context['medium_priority'] = priority_data['medium']
-        context['high_priority'] = priority_data['high']
-        context['urgent_priority'] = priority_data['urgent']
-        context['dates'] = [date.strftime(
-            '%Y-%m-%dT%H:%M:%S.%fZ') for date in dates]
+        context['upcoming_occurrences'] = TaskOccurrence.objects.filter(
+            user=self.request.user,
+            date__range=(today, today + timedelta(days=HORIZON_DAYS)),
+        ).select_related('task').order_by('date', 'task_id')[:self.upcoming_limit]
+        return context
+
+
+def group_by_category(tasks):
+    """
+    Split tasks into (uncategorized, {category: tasks}) in one pass, keeping their order.
 
+    Tasks should come with select_related('category') so this doesn't query per task.
+    """
+    uncategorized, groups = [], {}
+    for task in tasks:
+        if task.category_id is None:
+            uncategorized.append(task)
+        else:
+            groups.setdefault(task.category, []).append(task)
+    return uncategorized, dict(sorted(groups.items(), key=lambda group: group[0].pk))
+
+
+class TaskGroupsMixin(ContextMixin):
+    # The page of tasks grouped by category for the list templates, see group_by_category
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['uncategorized_tasks'], context['task_groups'] = group_by_category(context['object_list'])
+        context['categories'] = list(context['task_groups'])
         return context
 
 
-class TaskListView(LoginRequiredMixin, TaskCountsMixin, ListView):
+class TaskListView(LoginRequiredMixin, TaskCountsMixin, KeysetPaginationMixin, ListView):
     model = Task
     template_name = 'task_list.html'  # aka home. too lazy to change names
     context_object_name = 'tasks'  # this can be used in the template to get the objects
+    keyset = 'created_at'
+    keyset_descending = True
 
     def get_queryset(self):
         user = self.request.user
@@ -173,7 +149,7 @@ class TaskDeleteView(LoginRequiredMixin, DeleteView):
     def get_queryset(self):
         user = self.request.user
         # Allow access if the user is the creator or is assigned to the task
-        return Task.objects.filter(Q(user=user) | Q(assigned_to=user))
+        return Task.objects.visible_to(user)
 
 
 class CategoryListView(LoginRequiredMixin, ListView):
@@ -231,37 +207,38 @@ class CategoryDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('category_list')
 
 
-class AllTaskListView(LoginRequiredMixin, ListView):
+class CategorizedTaskListView(LoginRequiredMixin, TaskGroupsMixin, KeysetPaginationMixin, ListView):
+    """
+    Base of the task lists grouped by category (all, scheduled, overdue, recurring, bookmarks).
+
+    Subclasses only say which of the user's tasks they show through get_filters().
+    The page of tasks is fetched once with its categories and the category list
+    is derived from it, so the whole list costs one task query.
+    """
     model = Task
-    template_name = 'all_list.html'
-    context_object_name = 'tasks'
+    context_object_name = 'tasks'  # this can be used in the template to get the objects
+
+    def get_filters(self):
+        return {}
 
     def get_queryset(self):
-        user = self.request.user
-        # Fetch all tasks created by the user or assigned to the user
-        queryset = Task.objects.filter(Q(user=user) | Q(assigned_to=user)).select_related('category')
-        return queryset
+        # Tasks created by the user or assigned to the user
+        return Task.objects.visible_to(self.request.user, **self.get_filters()).select_related('category')
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
-        # Get categories that have tasks created by or assigned to the user
-        categories_with_tasks = Category.objects.filter(
-            task__in=Task.objects.filter(Q(user=user) | Q(assigned_to=user))
-        ).distinct()
 
-        # Pass tasks grouped by categories, including uncategorized
-        context['tasks'] = self.get_queryset()
-        context['categories'] = categories_with_tasks
+class AllTaskListView(CategorizedTaskListView):
+    template_name = 'all_list.html'
 
-        return context
+    def get_filters(self):
+        return {'completed': False}
 
 
-class CompletedTaskListView(LoginRequiredMixin, ListView):
+class CompletedTaskListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Task
     template_name = 'completed_list.html'
     context_object_name = 'tasks'  # this can be used in the template to get the objects
+    keyset = 'created_at'
+    keyset_descending = True
 
     def get_queryset(self):
         # Filter tasks to only include completed ones
@@ -274,74 +251,40 @@ class CompletedTaskListView(LoginRequiredMixin, ListView):
         return context
 
 
-class ScheduledTaskListView(LoginRequiredMixin, ListView):
-    model = Task
+class ScheduledTaskListView(UpcomingOccurrencesMixin, CategorizedTaskListView):
     template_name = 'scheduled_list.html'
-    context_object_name = 'tasks'  # this can be used in the template to get the objects
 
-    def get_queryset(self):
-        user = self.request.user
-        now = timezone.now()
-        queryset = Task.objects.filter(
-            user=user,  due_date__gte=now, due_date__isnull=False)
-        return queryset
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
-        # Get categories that have tasks created by or assigned to the user
-        categories_with_tasks = Category.objects.filter(
-            task__in=Task.objects.filter(Q(user=user) | Q(assigned_to=user))
-        ).distinct()
-
-        # Pass tasks grouped by categories, including uncategorized
-        context['tasks'] = self.get_queryset()
-        context['categories'] = categories_with_tasks
-
-        return context
+    def get_filters(self):
+        return {'due_date__gte': timezone.now(), 'due_date__isnull': False, 'completed': False}
 
 
-class OverdueTaskListView(LoginRequiredMixin, ListView):
-    model = Task
+class OverdueTaskListView(CategorizedTaskListView):
     template_name = 'overdue_list.html'
-    context_object_name = 'tasks'  # this can be used in the template to get the objects
 
-    def get_queryset(self):
-        user = self.request.user
-        now = timezone.now()
+    def get_filters(self):
         # __lt stands for "less than". This condition filters tasks where the due_date is less than the current date and time, meaning the tasks are overdue.
-        queryset = Task.objects.filter(
-            user=user, due_date__lt=now, due_date__isnull=False)
-        return queryset
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
-        # Get categories that have tasks created by or assigned to the user
-        categories_with_tasks = Category.objects.filter(
-            task__in=Task.objects.filter(Q(user=user) | Q(assigned_to=user))
-        ).distinct()
-
-        # Pass tasks grouped by categories, including uncategorized
-        context['tasks'] = self.get_queryset()
-        context['categories'] = categories_with_tasks
-
-        return context
+        return {'due_date__lt': timezone.now(), 'due_date__isnull': False, 'completed': False}
 
 
 class SearchTaskView(LoginRequiredMixin, ListView):
-    model = Task
     template_name = 'search_task.html'
-    context_object_name = 'tasks'
+    context_object_name = 'results'
+    paginate_by = 20
 
     def get_queryset(self):
-        query = self.request.GET.get('q')
-        if query:
-            return Task.objects.filter(user=self.request.user, title__icontains=query)
-        else:
-            return Task.objects.none()
+        # Ranked matches in tasks, comments and chat messages the user can see, see search.search
+        return search(self.request.user, self.request.GET.get('q'))
+
+
+@login_required
+def search_suggestions(request):
+    # As-you-type completions from the user's in-memory prefix index, see typeahead.suggest
+    urls = {'task': 'update_task', 'category': 'tasks_by_category'}
+    suggestions = suggest(request.user, request.GET.get('q', ''))
+    return JsonResponse({'results': [
+        {'kind': kind, 'id': pk, 'label': label, 'url': reverse(urls[kind], args=[pk])}
+        for kind, pk, label in suggestions
+    ]})
 
 
 def mark_completed(request):
@@ -352,22 +295,58 @@ def mark_completed(request):
         completed = data.get('completed')
 
         try:
-            task = Task.objects.get(id=task_id)
+            # The post_save logging reads both users, load them with the task
+            task = Task.objects.select_related('user', 'assigned_to').get(id=task_id)
             task.completed = completed
-            task.save()
+            task.save(update_fields=['completed'])
             return JsonResponse({'success': True})
         except Task.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Task not found'})
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
 
+@login_required
+def mark_completed_bulk(request):
+    # Body: {"updates": [{"task_id": 1, "completed": true}, ...]}, applied set-based by bulk.set_completed
+    if request.method == 'POST':
+        import json
+        try:
+            updates = {}
+            for update in json.loads(request.body)['updates']:
+                # Only JSON booleans, bool("false") would complete the task
+                if not isinstance(update['completed'], bool):
+                    raise TypeError(update['completed'])
+                updates[int(update['task_id'])] = update['completed']
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+        return JsonResponse({'success': True, 'updated': set_completed(request.user, updates)})
+    return JsonResponse({'success': False, 'error': 'Invalid request'})
+
+
+@login_required
+def bulk_task_operation(request):
+    # Body: {"operation": "reassign", "task_ids": [1, 2], "value": 7}, see bulk.OPERATIONS
+    if request.method == 'POST':
+        import json
+        try:
+            data = json.loads(request.body)
+            operation, task_ids = data['operation'], [int(task_id) for task_id in data['task_ids']]
+            if operation not in OPERATIONS:
+                raise ValueError(operation)
+            updated = apply_operation(request.user, operation, task_ids, data.get('value'))
+        except (ValueError, TypeError, KeyError, ValidationError):
+            return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+        return JsonResponse({'success': True, 'updated': updated})
+    return JsonResponse({'success': False, 'error': 'Invalid request'})
+
+
 class ClearCompletedTasksView(RedirectView):
     # Redirect to the completed list after deletion
     url = reverse_lazy('completed_list')
 
     def post(self, request, *args, **kwargs):
-        # Delete all completed tasks
-        Task.objects.filter(completed=True).delete()
+        # Delete all completed tasks in chunks, see bulk.clear_completed_tasks
+        clear_completed_tasks(Task.objects.filter(completed=True))
         return super().post(request, *args, **kwargs)
 
 
@@ -422,46 +401,20 @@ class DeleteCommentView(LoginRequiredMixin, DeleteView):
         return reverse_lazy('update_task', kwargs={'pk': task.pk})
 
 
-class RecurringListView(LoginRequiredMixin, ListView):
-    model = Task
+class RecurringListView(UpcomingOccurrencesMixin, CategorizedTaskListView):
     template_name = 'recurring_list.html'
-    context_object_name = 'tasks'  # this can be used in the template to get the objects
 
-    def get_queryset(self):
-        user = self.request.user
-        today = timezone.now().date()  # Get today's date
-        queryset = Task.objects.filter(
-            user=user,
-            recurring=True,  # Only include tasks marked as recurring
-            completed=False,
-        )
-        return queryset
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.request.user
-        
-        # Get categories that have tasks created by or assigned to the user
-        categories_with_tasks = Category.objects.filter(
-            task__in=Task.objects.filter(Q(user=user) | Q(assigned_to=user))
-        ).distinct()
-
-        # Pass tasks grouped by categories, including uncategorized
-        context['tasks'] = self.get_queryset()
-        context['categories'] = categories_with_tasks
-
-        return context
+    def get_filters(self):
+        return {'recurring': True, 'completed': False}  # Only include tasks marked as recurring
 
 
-class BookmarkView(LoginRequiredMixin, ListView):
-    model = Task
+class BookmarkView(CategorizedTaskListView):
     template_name = 'bookmark_list.html'
-    context_object_name = 'tasks'  # this can be used in the template to get the objects
+    keyset = 'created_at'
+    keyset_descending = True
 
-    def get_queryset(self):
-        user = self.request.user
-        queryset = Task.objects.filter(user=user, bookmarked=True)
-        return queryset
+    def get_filters(self):
+        return {'bookmarked': True, 'completed': False}
 
 
 
@@ -488,8 +441,13 @@ def notifications_view(request):
 
 def mark_notifications_as_read(request):
     if request.user.is_authenticated:
-        Notification.objects.filter(
+        marked = Notification.objects.filter(
             user=request.user, is_read=False).update(is_read=True)
+        if marked:
+            # Subtract what we actually marked so notifications created meanwhile stay counted
+            Profile.objects.filter(user=request.user).update(
+                unread_notifications=Greatest(F('unread_notifications') - marked, 0))
+            push_unread_delta(request.user.pk, -marked)
     return redirect('task_list')
 
 